@@ -3,6 +3,7 @@ from ...shared.utils.api_utils import build_req_parser
 from ..models.api_baseline import APIBaseline
 from ..models.api_reports import APIReport
 from ..connectors.influx import get_aggregated_test_results
+from ..utils.baseline_utils import store_baseline_requests
 
 
 class BaselineAPI(RestResource):
@@ -36,8 +37,11 @@ class BaselineAPI(RestResource):
     def post(self, project_id: int):
         args = self._parser_post.parse_args(strict=False)
         project = self.rpc.project_get_or_404(project_id=project_id)
-        report_id = APIReport.query.filter_by(project_id=project_id, name=args['test_name'],
-                                              build_id=args['build_id']).first().to_json()['id']
+        report = APIReport.query.filter_by(project_id=project_id, name=args['test_name'],
+                                           build_id=args['build_id'], deleted=False).first()
+        if not report:
+            return {"message": "not found"}, 404
+        report_id = report.id
         baseline = APIBaseline.query.filter_by(project_id=project.id, test=args.get("test_name"),
                                                environment=args.get("env")).first()
         if baseline:
@@ -52,4 +56,5 @@ class BaselineAPI(RestResource):
                                report_id=report_id,
                                summary=summary)
         baseline.insert()
+        store_baseline_requests(baseline.id, summary)
         return {"message": "baseline is set"}
\ No newline at end of file
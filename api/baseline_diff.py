@@ -0,0 +1,33 @@
+from flask_restful import inputs
+
+from ...shared.utils.restApi import RestResource
+from ...shared.utils.api_utils import build_req_parser
+from ..models.api_reports import APIReport
+from ..utils.baseline_utils import get_report_diff
+
+
+class BaselineDiffAPI(RestResource):
+    get_rules = (
+        dict(name="report_id", type=int, location="args"),
+        dict(name="regressions", type=inputs.boolean, default=False, location="args")
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.__init_req_parsers()
+
+    def __init_req_parsers(self):
+        self._parser_get = build_req_parser(rules=self.get_rules)
+
+    def get(self, project_id: int):
+        args = self._parser_get.parse_args(strict=False)
+        project = self.rpc.project_get_or_404(project_id=project_id)
+        report = APIReport.query.filter_by(project_id=project.id, id=args["report_id"], deleted=False).first()
+        if not report:
+            return {"message": "not found"}, 404
+        diff = get_report_diff(report)
+        if diff is None:
+            return {"message": "baseline is not set"}, 404
+        if args["regressions"]:
+            diff["rows"] = [each for each in diff["rows"] if each["regression"]]
+        return {"report_id": report.id, **diff}
@@ -0,0 +1,38 @@
+import orjson
+from flask import Response, stream_with_context
+
+from ...shared.utils.restApi import RestResource
+from ...shared.utils.api_utils import build_req_parser
+from ..utils.live_stream import live_hub
+from .charts import ReportChartsAPI
+
+
+class ChartStreamAPI(RestResource):
+    """ Server-Sent Events with the summary, hits and average charts of a running build """
+    get_rules = ReportChartsAPI.get_rules
+
+    def __init__(self):
+        super().__init__()
+        self.__init_req_parsers()
+
+    def __init_req_parsers(self):
+        self._parser_get = build_req_parser(rules=self.get_rules)
+
+    def get(self):
+        args = self._parser_get.parse_args(strict=False)
+        if not args.get("build_id"):
+            return {"message": "build_id is required"}, 400
+        subscription = live_hub.subscribe(args)
+
+        def stream():
+            try:
+                for event, data in subscription.events():
+                    if event is None:
+                        yield ": keepalive\n\n"
+                    else:
+                        yield f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+            finally:
+                live_hub.unsubscribe(subscription)
+
+        return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,7 +1,12 @@
+from flask import request
+from flask_restful import inputs
+
 from ...shared.utils.restApi import RestResource
 from ...shared.utils.api_utils import build_req_parser
 from ..utils.charts_utils import (requests_summary, requests_hits, avg_responses, summary_table, get_issues,
-                                  get_data_from_influx)
+                                  get_data_from_influx, get_batch_data, cached_chart, chart_etag, incremental_chart)
+from ..utils.http_utils import conditional_response, encoded_response
+from ..constants import COLUMNAR_MIMETYPE
 
 
 class ReportChartsAPI(RestResource):
@@ -17,7 +22,14 @@ class ReportChartsAPI(RestResource):
         dict(name="build_id", type=str, location="args"),
         dict(name="test_name", type=str, location="args"),
         dict(name="lg_type", type=str, location="args"),
-        dict(name='status', type=str, default='all', location="args")
+        dict(name='status', type=str, default='all', location="args"),
+        dict(name="downsample", type=int, default=0, location="args"),
+        dict(name="format", type=str, default="", location="args"),
+        dict(name="since", type=str, default=None, location="args"),
+        dict(name="with_total", type=inputs.boolean, default=False, location="args")
+    )
+    post_rules = tuple(dict(rule, location="json") for rule in get_rules) + (
+        dict(name="specs", type=list, default=[], location="json"),
     )
     mapping = {
         "requests": {
@@ -31,6 +43,14 @@ class ReportChartsAPI(RestResource):
             "table": get_issues
         }
     }
+    post_mapping = {
+        "requests": {
+            "batch": get_batch_data
+        }
+    }
+    # charts over the build timeline that can be polled incrementally with a since cursor
+    timelines = {("requests", "summary"), ("requests", "hits"), ("requests", "average"), ("requests", "data"),
+                 ("requests", "batch")}
 
     def __init__(self):
         super().__init__()
@@ -38,7 +58,21 @@ class ReportChartsAPI(RestResource):
 
     def __init_req_parsers(self):
         self._parser_get = build_req_parser(rules=self.get_rules)
+        self._parser_post = build_req_parser(rules=self.post_rules)
+
+    def _respond(self, source, target, func, args):
+        if COLUMNAR_MIMETYPE in request.headers.get("Accept", ""):
+            args["format"] = "columnar"
+        mimetype = COLUMNAR_MIMETYPE if args.get("format") == "columnar" else "application/json"
+        if args.get("since") is not None and args.get("build_id") and (source, target) in self.timelines:
+            return encoded_response(incremental_chart(source, target, func, args), mimetype=mimetype)
+        etag, ctx = chart_etag(source, target, args)
+        return conditional_response(etag, lambda: cached_chart(source, target, func, args, ctx=ctx), mimetype)
 
     def get(self, source: str, target: str):
         args = self._parser_get.parse_args(strict=False)
-        return self.mapping[source][target](args)
+        return self._respond(source, target, self.mapping[source][target], args)
+
+    def post(self, source: str, target: str):
+        args = self._parser_post.parse_args(strict=False)
+        return self._respond(source, target, self.post_mapping[source][target], args)
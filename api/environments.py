@@ -22,6 +22,6 @@ class EnvironmentsAPI(RestResource):
         project = self.rpc.project_get_or_404(project_id=project_id)
         query_result = APIReport.query.with_entities(APIReport.environment).distinct().filter(
             and_(APIReport.name == args.get("name"),
-                 APIReport.project_id == project.id)
+                 APIReport.project_id == project.id, APIReport.deleted.is_(False))
         ).order_by(APIReport.id.asc()).all()
         return list(set([each.environment for each in query_result]))
\ No newline at end of file
@@ -0,0 +1,11 @@
+from ...shared.utils.restApi import RestResource
+from ..utils.deletion import deletion_worker
+
+
+class ReportDeletionAPI(RestResource):
+    def get(self, project_id: int, job_id: str):
+        project = self.rpc.project_get_or_404(project_id=project_id)
+        job = deletion_worker.progress(job_id)
+        if not job or job["project_id"] != project.id:
+            return {"message": "not found"}, 404
+        return job
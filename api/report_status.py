@@ -3,6 +3,7 @@ from json import loads
 from ...shared.utils.restApi import RestResource
 from ...shared.utils.api_utils import build_req_parser
 from ..models.api_reports import APIReport
+from ..utils.charts_utils import invalidate_chart_cache
 
 
 class ReportStatusAPI(RestResource):
@@ -19,14 +20,19 @@ class ReportStatusAPI(RestResource):
 
     def get(self, project_id: int, report_id: int):
         project = self.rpc.project_get_or_404(project_id=project_id)
-        report = APIReport.query.filter_by(project_id=project.id, id=report_id).first().to_json()
-        return {"message": report["test_status"]["status"]}
+        report = APIReport.query.filter_by(project_id=project.id, id=report_id, deleted=False).first()
+        if not report:
+            return {"message": "not found"}, 404
+        return {"message": report.to_json()["test_status"]["status"]}
 
     def put(self, project_id: int, report_id: int):
         args = self._parser_put.parse_args(strict=False)
         project = self.rpc.project_get_or_404(project_id=project_id)
-        report = APIReport.query.filter_by(project_id=project.id, id=report_id).first()
+        report = APIReport.query.filter_by(project_id=project.id, id=report_id, deleted=False).first()
+        if not report:
+            return {"message": "not found"}, 404
         test_status = args["test_status"]
         report.test_status = test_status
         report.commit()
+        invalidate_chart_cache(report.build_id)
         return {"message": f"status changed to {report.test_status['status']}"}
@@ -4,10 +4,16 @@ from json import loads
 from ...shared.utils.restApi import RestResource
 from ...shared.utils.api_utils import build_req_parser
 from ...projects.models.statistics import Statistic
-from ..models.api_baseline import APIBaseline
 from ..models.api_reports import APIReport
-from ..utils.utils import get
-from ..connectors.influx import get_test_details, delete_test_data
+from ..models.api_report_requests import APIReportRequest
+from ..utils.utils import get_page, report_columns, report_fingerprint, valid_cursor
+from ..utils.http_utils import make_etag, conditional_response
+from ..utils.deletion import deletion_worker
+from ..utils.threshold_utils import evaluate_thresholds
+from ..utils.baseline_utils import summary_rows, store_report_diff
+from ..connectors.influx import get_test_details
+from ..utils.charts_utils import invalidate_chart_cache, schedule_build_archive
+from ..connectors.archive import delete_archive
 
 
 class ReportAPI(RestResource):
@@ -19,7 +25,9 @@ class ReportAPI(RestResource):
         dict(name="order", type=str, default="", location="args"),
         dict(name="name", type=str, location="args"),
         dict(name="filter", type=str, location="args"),
-        dict(name="report_id", type=int, default=None, location="args")
+        dict(name="report_id", type=int, default=None, location="args"),
+        dict(name="cursor", type=str, default=None, location="args"),
+        dict(name="include", type=str, default="", location="args")
     )
     delete_rules = (
         dict(name="id[]", type=int, action="append", location="args"),
@@ -54,22 +62,23 @@ class ReportAPI(RestResource):
 
     def get(self, project_id: int):
         args = self._parser_get.parse_args(strict=False)
+        if args.get("cursor") and not valid_cursor(args["cursor"]):
+            return {"message": "invalid cursor"}, 400
+        etag = make_etag(project_id, args, report_fingerprint(APIReport.project_id == project_id,
+                                                              APIReport.deleted.is_(False)), weak=True)
+        return conditional_response(etag, lambda: self._get(project_id, args))
+
+    def _get(self, project_id, args):
         if args.get("report_id"):
-            report = APIReport.query.filter_by(project_id=project_id, id=args.get("report_id")).first().to_json()
-            return report
-        reports = []
+            report = APIReport.query.filter_by(project_id=project_id, id=args.get("report_id"), deleted=False).first()
+            if not report:
+                return {"message": "not found"}, 404
+            return report.to_json()
         project = self.rpc.project_get_or_404(project_id=project_id)
-        total, res = get(project, args, APIReport)
-        for each in res:
-            each_json = each.to_json()
-            each_json["start_time"] = each_json["start_time"].replace("T", " ").split(".")[0]
-            each_json["duration"] = int(each_json["duration"] if each_json["duration"] else 0)
-            try:
-                each_json["failure_rate"] = round((each_json["failures"] / each_json["total"]) * 100, 2)
-            except ZeroDivisionError:
-                each_json["failure_rate"] = 0
-            reports.append(each_json)
-        return {"total": total, "rows": reports}
+        include = [_.strip() for _ in args.get("include", "").split(",") if _.strip()]
+        total, reports, next_cursor = get_page(project, args, APIReport, report_columns(include),
+                                               additional_filter={"deleted": False})
+        return {"total": total, "rows": reports, "next_cursor": next_cursor}
 
     def post(self, project_id: int):
         args = self._parser_post.parse_args(strict=False)
@@ -122,13 +131,18 @@ class ReportAPI(RestResource):
                                      lg_type=args["lg_type"])
         response_times = loads(args["response_times"])
         report = APIReport.query.filter(
-            and_(APIReport.project_id == project.id, APIReport.build_id == args["build_id"])
+            and_(APIReport.project_id == project.id, APIReport.build_id == args["build_id"],
+                 APIReport.deleted.is_(False))
         ).first()
+        if not report:
+            return {"message": "not found"}, 404
         report.end_time = test_data["end_time"]
         report.start_time = test_data["start_time"]
         report.failures = test_data["failures"]
         report.total = test_data["total"]
-        report.thresholds_missed = args.get("missed", 0)
+        summary = summary_rows(report)
+        thresholds = evaluate_thresholds(project.id, report.build_id, report.name, report.environment, rows=summary)
+        report.thresholds_missed = thresholds["missed"] if thresholds["results"] else args.get("missed", 0)
         report.throughput = test_data["throughput"]
         report.pct50 = response_times["pct50"]
         report.pct75 = response_times["pct75"]
@@ -152,18 +166,28 @@ class ReportAPI(RestResource):
         report.vusers = args["vusers"]
         report.duration = args["duration"]
         report.commit()
+        APIReportRequest.replace_for_report(report, test_data["requests"])
+        store_report_diff(report, summary)
+        invalidate_chart_cache(report.build_id)
+        schedule_build_archive(project.id, report.build_id, test_data["requests"])
         return {"message": "updated"}
 
     def delete(self, project_id: int):
         args = self._parser_delete.parse_args(strict=False)
         project = self.rpc.project_get_or_404(project_id=project_id)
-        query_result = APIReport.query.filter(
-            and_(APIReport.project_id == project.id, APIReport.id.in_(args["id[]"]))
+        reports = APIReport.query.with_entities(
+            APIReport.id, APIReport.build_id, APIReport.name, APIReport.lg_type
+        ).filter(
+            and_(APIReport.project_id == project.id, APIReport.id.in_(args["id[]"]), APIReport.deleted.is_(False))
         ).all()
-        for each in query_result:
-            delete_test_data(each.build_id, each.name, each.lg_type)
-            baseline = APIBaseline.query.filter_by(project_id=project.id, report_id=each.id).first()
-            if baseline:
-                baseline.delete()
-            each.delete()
-        return {"message": "deleted"}
+        if not reports:
+            return {"message": "deleted", "job_id": None}
+        report_ids = [each.id for each in reports]
+        APIReport.query.filter(APIReport.id.in_(report_ids)).update({"deleted": True}, synchronize_session=False)
+        APIReportRequest.query.filter(APIReportRequest.report_id.in_(report_ids)).delete(synchronize_session=False)
+        APIReport.query.session.commit()
+        for each in reports:
+            invalidate_chart_cache(each.build_id)
+            delete_archive(project.id, each.build_id)
+        job_id = deletion_worker.submit(project.id, [tuple(each) for each in reports])
+        return {"message": "deleted", "job_id": job_id}
@@ -1,6 +1,9 @@
 from ...shared.utils.restApi import RestResource
 from ...shared.utils.api_utils import build_req_parser
 from ..models.api_reports import APIReport
+from ..models.api_report_requests import APIReportRequest
+from ..utils.utils import report_fingerprint
+from ..utils.http_utils import make_etag, conditional_response
 from sqlalchemy import and_
 
 
@@ -8,7 +11,9 @@ class RequestsAPI(RestResource):
     get_rules = (
         dict(name="name", type=str, location="args"),
         dict(name="env", type=str, location="args"),
-        dict(name="type", type=str, default="backend", location="args")
+        dict(name="type", type=str, default="backend", location="args"),
+        dict(name="search", type=str, default="", location="args"),
+        dict(name="limit", type=int, default=0, location="args")
     )
 
     def __init__(self):
@@ -20,14 +25,21 @@ class RequestsAPI(RestResource):
 
     def get(self, project_id: int):
         args = self._parser_get.parse_args(strict=False)
+        etag = make_etag(project_id, args, report_fingerprint(
+            APIReport.name == args.get("name"), APIReport.environment == args.get("env"),
+            APIReport.project_id == project_id, APIReport.deleted.is_(False)
+        ), weak=True)
+        return conditional_response(etag, lambda: self._get(project_id, args))
+
+    def _get(self, project_id, args):
         project = self.rpc.project_get_or_404(project_id=project_id)
-        requests_data = set()
-        query_result = APIReport.query.filter(
-            and_(APIReport.name == args.get("name"), APIReport.environment == args.get("env"),
-                 APIReport.project_id == project.id)
-        ).order_by(APIReport.id.asc()).all()
-        for each in query_result:
-            requests_data.update(set(each.requests.split(";")))
-        if "All" in requests_data:
-            requests_data.remove("All")
-        return list(requests_data)
+        query = APIReportRequest.query.with_entities(APIReportRequest.request_name).filter(
+            and_(APIReportRequest.project_id == project.id, APIReportRequest.test == args.get("name"),
+                 APIReportRequest.environment == args.get("env"))
+        )
+        if args.get("search"):
+            query = query.filter(APIReportRequest.request_name.startswith(args["search"], autoescape=True))
+        query = query.distinct().order_by(APIReportRequest.request_name)
+        if args.get("limit"):
+            query = query.limit(args["limit"])
+        return [each.request_name for each in query.all()]
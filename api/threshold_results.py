@@ -0,0 +1,12 @@
+from ...shared.utils.restApi import RestResource
+from ..models.api_reports import APIReport
+from ..utils.threshold_utils import evaluate_thresholds
+
+
+class ThresholdResultsAPI(RestResource):
+    def get(self, project_id: int, build_id: str):
+        project = self.rpc.project_get_or_404(project_id=project_id)
+        report = APIReport.query.filter_by(project_id=project.id, build_id=build_id, deleted=False).first()
+        if not report:
+            return {"message": "not found"}, 404
+        return evaluate_thresholds(project.id, build_id, report.name, report.environment)
@@ -0,0 +1,140 @@
+#   Copyright 2021 getcarrier.io
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import OrderedDict
+from json import dump, load
+from os import path, makedirs, replace
+from shutil import rmtree
+from threading import Lock
+from uuid import uuid4
+
+import numpy as np
+
+from ..constants import ARCHIVE_PATH, ARCHIVE_OPEN_LIMIT
+from .influx import aggregation_seconds
+from .sketches import load_sketches
+
+ARCHIVE_METRICS = ["Min", "Median", "Max", "pct90", "pct95", "pct99", "Throughput", "Errors",
+                   "1xx", "2xx", "3xx", "4xx", "5xx"]
+
+_open_archives = OrderedDict()
+_open_lock = Lock()
+
+
+def archive_path(project_id, build_id):
+    return path.join(ARCHIVE_PATH, str(project_id), build_id)
+
+
+class BuildArchive:
+    """
+    Columnar snapshot of a finished build at one aggregation:
+    timeline.bin holds int64 epochs, series.bin a float64 matrix with one row per (scope, metric), NaN for gaps
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sketches = None
+        with open(path.join(directory, "index.json")) as index_file:
+            self.index = load(index_file)
+        self.aggregation = self.index["aggregation"]
+        self.sampler = self.index["sampler"]
+        self.requests = self.index["requests"]
+        self.rows = {tuple(key.split("\t", 1)): row for key, row in self.index["rows"].items()}
+        length = self.index["length"]
+        self._timeline = np.memmap(path.join(directory, "timeline.bin"), dtype="<i8", mode="r", shape=(length,)) \
+            if length else np.zeros(0, dtype="<i8")
+        self._series = np.memmap(path.join(directory, "series.bin"), dtype="<f8", mode="r",
+                                 shape=(len(self.rows), length)) \
+            if length and self.rows else np.zeros((len(self.rows), length), dtype="<f8")
+
+    @property
+    def sketches(self):
+        """ Latency sketches written next to the archive, None until they exist """
+        if self._sketches is None:
+            self._sketches = load_sketches(self.directory)
+        return self._sketches
+
+    def window(self, start_ts, end_ts):
+        # influx labels each bucket with its aligned start, the bucket holding start_ts begins before it
+        start_ts -= start_ts % aggregation_seconds(self.aggregation)
+        return slice(int(np.searchsorted(self._timeline, start_ts, side="left")),
+                     int(np.searchsorted(self._timeline, end_ts, side="right")))
+
+    def covers(self, start_ts, end_ts):
+        return self.index["start"] <= start_ts and end_ts <= self.index["end"]
+
+    def has(self, scope, metric):
+        return (scope, metric) in self.rows
+
+    def timeline(self, window):
+        return self._timeline[window].tolist()
+
+    def series(self, scope, metric, window):
+        timeline = self._timeline[window].tolist()
+        row = self.rows.get((scope, metric))
+        if row is None:
+            return dict.fromkeys(timeline)
+        values = self._series[row, window]
+        return {ts: (None if np.isnan(value) else value)
+                for ts, value in zip(timeline, values.tolist())}
+
+
+def write_archive(project_id, build_id, aggregation, sampler, start_ts, end_ts, timestamps, series, requests):
+    """
+    :param series: - {(scope, metric): {ts: value}}, users are stored under ("", "Users")
+    """
+    directory = archive_path(project_id, build_id)
+    tmp_directory = f"{directory}.{uuid4().hex}.tmp"
+    makedirs(tmp_directory)
+    rows = {}
+    matrix = np.full((len(series), len(timestamps)), np.nan, dtype="<f8")
+    for row, ((scope, metric), values) in enumerate(series.items()):
+        rows[f"{scope}\t{metric}"] = row
+        matrix[row] = [np.nan if values.get(ts) is None else values[ts] for ts in timestamps]
+    np.asarray(timestamps, dtype="<i8").tofile(path.join(tmp_directory, "timeline.bin"))
+    matrix.tofile(path.join(tmp_directory, "series.bin"))
+    with open(path.join(tmp_directory, "index.json"), "w") as index_file:
+        dump({"aggregation": aggregation, "sampler": sampler, "start": start_ts, "end": end_ts,
+              "length": len(timestamps), "requests": requests, "rows": rows}, index_file)
+    if path.exists(directory):
+        rmtree(directory)
+    replace(tmp_directory, directory)
+    _forget(project_id, build_id)
+
+
+def load_archive(project_id, build_id):
+    key = (project_id, build_id)
+    with _open_lock:
+        if key in _open_archives:
+            _open_archives.move_to_end(key)
+            return _open_archives[key]
+    directory = archive_path(project_id, build_id)
+    if not path.exists(path.join(directory, "index.json")):
+        return None
+    archive = BuildArchive(directory)
+    with _open_lock:
+        _open_archives[key] = archive
+        while len(_open_archives) > ARCHIVE_OPEN_LIMIT:
+            _open_archives.popitem(last=False)
+    return archive
+
+
+def _forget(project_id, build_id):
+    with _open_lock:
+        _open_archives.pop((project_id, build_id), None)
+
+
+def delete_archive(project_id, build_id):
+    _forget(project_id, build_id)
+    rmtree(archive_path(project_id, build_id), ignore_errors=True)
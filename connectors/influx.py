@@ -12,36 +12,64 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from datetime import datetime, timezone
+from collections import OrderedDict
+from math import ceil
+import re
+from threading import Lock
 
-from ...projects.connectors.influx import get_client
+from .influx_pool import run_query, run_batch, iter_query
 from ...shared.constants import str_to_timestamp, MAX_DOTS_ON_CHART
-from ..models.api_reports import APIReport
+from .query_context import get_context
+from ..constants import AGGREGATIONS, AGGREGATION_CACHE_SIZE, BENCHMARK_MIN_POINTS
 
+# chart series are keyed by integer epoch seconds instead of RFC3339 strings
+EPOCH = "s"
 
-def get_project_id(build_id):
-    return APIReport.query.filter_by(build_id=build_id).first().to_json()["project_id"]
+_aggregation_cache = OrderedDict()
+_aggregation_lock = Lock()
 
 
-def get_aggregated_test_results(test, build_id):
-    project_id = get_project_id(build_id)
+def get_project_id(build_id, ctx=None):
+    return get_context(build_id, ctx).project_id
+
+
+def get_aggregated_test_results(test, build_id, ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     query = f"SELECT * from api_comparison where simulation='{test}' and build_id='{build_id}'"
-    return list(get_client(project_id, f'comparison_{project_id}').query(query))
+    return list(run_query(project_id, query, f'comparison_{project_id}'))
 
 
-def delete_test_data(build_id, test_name, lg_type):
-    project_id = get_project_id(build_id)
+def delete_test_data(build_id, test_name, lg_type, ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     query_one = f"DELETE from {test_name} where build_id='{build_id}'"
     query_two = f"DELETE from api_comparison where build_id='{build_id}'"
-    client = get_client(project_id, f"{lg_type}_{project_id}")
-    client.query(query_one)
-    client.close()
-    client = get_client(project_id, f'comparison_{project_id}')
-    client.query(query_two)
-    client.close()
+    run_query(project_id, query_one, f"{lg_type}_{project_id}")
+    run_query(project_id, query_two, f'comparison_{project_id}')
     return True
 
 
+def delete_builds_data(project_id, lg_type, test_name, build_ids):
+    """ Deletes the raw points of several builds of one test with a single statement """
+    run_query(project_id, f"DELETE from {test_name} where {_tag_regex('build_id', build_ids)}",
+              f"{lg_type}_{project_id}")
+
+
+def delete_builds_resolutions(project_id, lg_type, test_name, build_ids, aggregations):
+    """ Drops raw points and the given rollups of several builds, one statement per measurement in one request """
+    regex = _tag_regex('build_id', build_ids)
+    measurements = [test_name] + [f"{test_name}_{each}" for each in aggregations] + \
+                   [f"users_{each}" for each in aggregations]
+    run_query(project_id, ";".join(f'DELETE from "{each}" where {regex}' for each in measurements),
+              f"{lg_type}_{project_id}")
+
+
+def delete_builds_comparison(project_id, build_ids):
+    run_query(project_id, f"DELETE from api_comparison where {_tag_regex('build_id', build_ids)}",
+              f"comparison_{project_id}")
+
+
 def get_test_details(project_id, build_id, test_name, lg_type):
     test = {
         "start_time": 0,
@@ -76,15 +104,17 @@ def get_test_details(project_id, build_id, test_name, lg_type):
     q_type = f"show tag values on comparison_{project_id} with key=\"test_type\" where build_id='{build_id}'"
     q_requests_name = f"show tag values on comparison_{project_id} with key=\"request_name\" " \
                       f"where build_id='{build_id}'"
-    client = get_client(project_id)
-    test["start_time"] = list(client.query(q_start_time)["users"])[0]["time"]
-    test["end_time"] = list(client.query(q_end_time)["users"])[0]["time"]
+    start_time, end_time, total_users, env, test_type, requests_name, response_codes = run_batch(
+        project_id, [q_start_time, q_end_time, q_total_users, q_env, q_type, q_requests_name, q_response_codes]
+    )
+    test["start_time"] = list(start_time["users"])[0]["time"]
+    test["end_time"] = list(end_time["users"])[0]["time"]
+    test["vusers"] = list(total_users["api_comparison"])[0]["value"]
+    test["environment"] = list(env["api_comparison"])[0]["value"]
+    test["type"] = list(test_type["api_comparison"])[0]["value"]
+    test["requests"] = [name["value"] for name in requests_name["api_comparison"]]
+    response_data = list(response_codes['api_comparison'])[0]
     test["duration"] = round(str_to_timestamp(test["end_time"]) - str_to_timestamp(test["start_time"]), 1)
-    test["vusers"] = list(client.query(q_total_users)["api_comparison"])[0]["value"]
-    test["environment"] = list(client.query(q_env)["api_comparison"])[0]["value"]
-    test["type"] = list(client.query(q_type)["api_comparison"])[0]["value"]
-    test["requests"] = [name["value"] for name in client.query(q_requests_name)["api_comparison"]]
-    response_data = list(client.query(q_response_codes)['api_comparison'])[0]
     test['total'] = response_data['Total']
     test['failures'] = response_data['KO']
     test['throughput'] = round(response_data['throughput'], 1)
@@ -97,7 +127,7 @@ def get_test_details(project_id, build_id, test_name, lg_type):
 
 
 def get_backend_requests(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                         timestamps=None, users=None, scope=None, aggr='pct95', status='all'):
+                         timestamps=None, users=None, scope=None, aggr='pct95', status='all', ctx=None):
     """
     :param build_id: - could be obtained from control_tower during tests execution
     :param test_name: - name of the test used as measurement in database
@@ -110,7 +140,8 @@ def get_backend_requests(build_id, test_name, lg_type, start_time, end_time, agg
     scope_addon = ""
     status_addon = ""
     group_by = ""
-    project_id = get_project_id(build_id)
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     aggr = aggr.lower()
 
     if scope and scope != 'All':
@@ -122,11 +153,11 @@ def get_backend_requests(build_id, test_name, lg_type, start_time, end_time, agg
         status_addon = f" and status='{status.upper()}'"
 
     if not (timestamps and users):
-        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     query = f"select time, {group_by}percentile(\"{aggr}\", 95) as rt from {lg_type}_{project_id}..{test_name}_{aggregation} " \
             f"where time>='{start_time}' and time<='{end_time}' {status_addon} and sampler_type='{sampler}' and " \
             f"build_id='{build_id}' {scope_addon} group by {group_by}time({aggregation})"
-    res = get_client(project_id).query(query)[f"{test_name}_{aggregation}"]
+    res = run_query(project_id, query, epoch=EPOCH)[f"{test_name}_{aggregation}"]
     results = {}
     if group_by:
         for _ in res:
@@ -146,35 +177,50 @@ def get_backend_requests(build_id, test_name, lg_type, start_time, end_time, agg
     return timestamps, results, users
 
 
-def get_backend_users(build_id, lg_type, start_time, end_time, aggregation):
-    project_id = get_project_id(build_id)
-    query = f"select sum(\"max\") from (select max(\"active\") from {lg_type}_{project_id}..\"users_{aggregation}\" " \
-            f"where build_id='{build_id}' group by lg_id) " \
-            f"WHERE time>='{start_time}' and time<='{end_time}' GROUP BY time(1s)"
-    client = get_client(project_id)
-    res = client.query(query)[f'users_{aggregation}']
+def iter_response_times(build_id, test_name, lg_type, start_ts, end_ts, sampler, chunk_size, ctx=None):
+    """ Raw response times within [start_ts, end_ts) as (request_name, times, values) of at most chunk_size points """
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
+    query = f"select response_time from {lg_type}_{project_id}..{test_name} " \
+            f"where time>={int(start_ts)}s and time<{int(end_ts)}s and sampler_type='{sampler}' and " \
+            f"build_id='{build_id}' group by request_name"
+    for chunk in iter_query(project_id, query, chunk_size, epoch=EPOCH):
+        for (_, tags), points in chunk.items():
+            times, values = [], []
+            for point in points:
+                times.append(point["time"])
+                values.append(point["response_time"])
+            yield (tags or {}).get("request_name"), times, values
+
+
+def get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=None):
+    ctx = get_context(build_id, ctx)
+    return ctx.memoize(("users", lg_type, start_time, end_time, aggregation), _get_backend_users,
+                       ctx.project_id, build_id, lg_type, start_time, end_time, aggregation)
+
+
+def _get_backend_users(project_id, build_id, lg_type, start_time, end_time, aggregation):
+    # per-second sum of active users across load generators, bucketed by its max at the chart aggregation
+    time_addon = f"time>='{start_time}' and time<='{end_time}'"
+    query = f"select max(\"sum\") from (select sum(\"max\") from (select max(\"active\") " \
+            f"from {lg_type}_{project_id}..\"users_{aggregation}\" where build_id='{build_id}' and {time_addon} " \
+            f"group by time(1s), lg_id) where {time_addon} group by time(1s)) " \
+            f"where {time_addon} group by time({aggregation})"
+    res = run_query(project_id, query, epoch=EPOCH)[f'users_{aggregation}']
     timestamps = []
     results = {"users": {}}
-    # aggregation of users
-    _tmp = []
-    if 'm' in aggregation:
-        aggregation = f"{str(int(aggregation.replace('m', '')) * 60)}s"
     for _ in res:
-        _tmp.append(_['sum'] if _['sum'] else 0)
-        results["users"][_['time']] = None
-        if _['time'] not in timestamps:
-            timestamps.append(_['time'])
-        if (len(_tmp) % int(aggregation.replace('s', ''))) == 0:
-            results["users"][_['time']] = max(_tmp)
-            _tmp = []
+        timestamps.append(_['time'])
+        results["users"][_['time']] = _['max'] if _['max'] else 0
     return timestamps, results
 
 
-def get_hits_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler, status='all'):
-    timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+def get_hits_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler, status='all', ctx=None):
+    ctx = get_context(build_id, ctx)
+    timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     results = {"throughput": {}}
     _, responses, _ = get_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                              timestamps, users, status=status)
+                              timestamps, users, status=status, ctx=ctx)
     results['throughput'] = responses['responses']
     # _, hits, _ = get_hits(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
     #                       timestamps, users, status=status)
@@ -183,10 +229,11 @@ def get_hits_tps(build_id, test_name, lg_type, start_time, end_time, aggregation
 
 
 def get_hits(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-             timestamps=None, users=None, scope=None, status='all'):
-    project_id = get_project_id(build_id)
+             timestamps=None, users=None, scope=None, status='all', ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     if not (timestamps and users):
-        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     scope_addon = ""
     status_addon = ""
     if scope and scope != 'All':
@@ -197,13 +244,13 @@ def get_hits(build_id, test_name, lg_type, start_time, end_time, aggregation, sa
                  f"time>='{start_time}' and time<='{end_time}'{status_addon} and sampler_type='{sampler}' and" \
                  f" build_id='{build_id}' {scope_addon}"
     results = {"hits": {}}
-    res = get_client(project_id).query(hits_query)[test_name]
+    res = run_query(project_id, hits_query)[test_name]
     for _ in res:
-        hit_time = datetime.fromtimestamp(float(_["hit"]), tz=timezone.utc)
-        if hit_time.strftime("%Y-%m-%dT%H:%M:%SZ") in results['hits']:
-            results['hits'][hit_time.strftime("%Y-%m-%dT%H:%M:%SZ")] += 1
+        hit_time = int(float(_["hit"]))
+        if hit_time in results['hits']:
+            results['hits'][hit_time] += 1
         else:
-            results['hits'][hit_time.strftime("%Y-%m-%dT%H:%M:%SZ")] = 1
+            results['hits'][hit_time] = 1
     # aggregation of hits
     _tmp = []
     if 'm' in aggregation:
@@ -222,10 +269,11 @@ def get_hits(build_id, test_name, lg_type, start_time, end_time, aggregation, sa
 
 
 def get_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-            timestamps=None, users=None, scope=None, status='all'):
-    project_id = get_project_id(build_id)
+            timestamps=None, users=None, scope=None, status='all', ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     if not (timestamps and users):
-        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     scope_addon = ""
     status_addon = ""
     if scope and scope != 'All':
@@ -236,7 +284,7 @@ def get_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sam
                       f" where time>='{start_time}' " \
                       f"and time<='{end_time}' and sampler_type='{sampler}' {status_addon} and build_id='{build_id}' " \
                       f"{scope_addon} group by time({aggregation})"
-    res = get_client(project_id).query(responses_query)[f"{test_name}_{aggregation}"]
+    res = run_query(project_id, responses_query, epoch=EPOCH)[f"{test_name}_{aggregation}"]
     results = {"responses": {}}
     for _ in timestamps:
         results['responses'][_] = None
@@ -245,9 +293,11 @@ def get_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sam
     return timestamps, results, users
 
 
-def average_responses(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler, status='all'):
-    project_id = get_project_id(build_id)
-    timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+def average_responses(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler, status='all',
+                      ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
+    timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     status_addon = ""
     if status != 'all':
         status_addon = f" and status='{status.upper()}'"
@@ -255,7 +305,7 @@ def average_responses(build_id, test_name, lg_type, start_time, end_time, aggreg
                       f"where time>='{start_time}' " \
                       f"and time<='{end_time}' and sampler_type='{sampler}'{status_addon} and " \
                       f"build_id='{build_id}' group by time({aggregation})"
-    res = get_client(project_id).query(responses_query)[f"{test_name}_{aggregation}"]
+    res = run_query(project_id, responses_query, epoch=EPOCH)[f"{test_name}_{aggregation}"]
     results = {"responses": {}}
     for _ in timestamps:
         results['responses'][_] = None
@@ -264,19 +314,21 @@ def average_responses(build_id, test_name, lg_type, start_time, end_time, aggreg
     return timestamps, results, users
 
 
-def get_build_data(build_id, test_name, lg_type, start_time, end_time, sampler, status='all'):
+def get_build_data(build_id, test_name, lg_type, start_time, end_time, sampler, status='all', ctx=None):
     status_addon = ""
-    project_id = get_project_id(build_id)
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
+    rollup = available_aggregation("5s", ctx.resolutions)
     if status != 'all':
         status_addon = f" and status='{status.upper()}'"
     # requests_in_range = f"select time, request_name, max(pct95) from {lg_type}_{project_id}..{test_name}_5s " \
     #                     f"where time>='{start_time}' " \
     #                     f"and time<='{end_time}' and sampler_type='{sampler}'{status_addon} and " \
     #                     f"build_id='{build_id}' group by request_name"
-    requests_in_range = f"select time, request_name, max(pct95) from {lg_type}_{project_id}..{test_name}_5s " \
+    requests_in_range = f"select time, request_name, max(pct95) from {lg_type}_{project_id}..{test_name}_{rollup} " \
                         f"where sampler_type='{sampler}'{status_addon} and " \
                         f"build_id='{build_id}' group by request_name"
-    res = get_client(project_id).query(requests_in_range)[f"{test_name}_5s"]
+    res = run_query(project_id, requests_in_range)[f"{test_name}_{rollup}"]
     requests_names = [f"'{each['request_name']}'" for each in res]
     if len(requests_names) > 1:
         requests = f'[{"|".join(requests_names)}]'
@@ -285,40 +337,36 @@ def get_build_data(build_id, test_name, lg_type, start_time, end_time, sampler,
     else:
         return []
     query = f"select * from comparison_{project_id}..api_comparison where build_id='{build_id}' and request_name=~/^{requests}/"
-    return list(get_client(project_id).query(query)['api_comparison'])
+    return list(run_query(project_id, query)['api_comparison'])
 
 
 def get_errors(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-               timestamps=None, users=None, scope=None):
-    project_id = get_project_id(build_id)
+               timestamps=None, users=None, scope=None, ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     if not (timestamps and users):
-        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     scope_addon = ""
     if scope and scope != 'All':
         scope_addon = f"and request_name='{scope}'"
     error_query = f"select time, count(status) from {lg_type}_{project_id}..{test_name}_{aggregation} " \
                   f"where time>='{start_time}' and time<='{end_time}' and sampler_type='{sampler}' and" \
-                  f" build_id='{build_id}' and status='KO' {scope_addon} group by time(1s)"
+                  f" build_id='{build_id}' and status='KO' {scope_addon} group by time({aggregation})"
     results = {"errors": {}}
     for _ in timestamps:
         results['errors'][_] = None
-    res = get_client(project_id).query(error_query)[f"{test_name}_{aggregation}"]
-    _tmp = []
-    if 'm' in aggregation:
-        aggregation = f"{str(int(aggregation.replace('m', ''))*60)}s"
-    for _ in res:
-        _tmp.append(_['count'])
-        if (len(_tmp) % int(aggregation.replace('s', ''))) == 0:
-            results['errors'][_['time']] = sum(_tmp)
-            _tmp = []
+    # count per bucket equals the sum of per-second error counts within it
+    for _ in run_query(project_id, error_query, epoch=EPOCH)[f"{test_name}_{aggregation}"]:
+        results['errors'][_['time']] = _['count']
     return timestamps, results, users
 
 
 def get_response_codes(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                       timestamps=None, users=None, scope=None, aggr="2xx", status='all'):
-    project_id = get_project_id(build_id)
+                       timestamps=None, users=None, scope=None, aggr="2xx", status='all', ctx=None):
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
     if not (timestamps and users):
-        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation)
+        timestamps, users = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
     scope_addon = ""
     status_addon = " "
     if scope and scope != 'All':
@@ -329,7 +377,7 @@ def get_response_codes(build_id, test_name, lg_type, start_time, end_time, aggre
                   f" where build_id='{build_id}' " \
                   f"and sampler_type='{sampler}' and time>='{start_time}' and time<='{end_time}'{status_addon} " \
                   f"{scope_addon}group by time({aggregation})"
-    res = get_client(project_id).query(rcode_query)[f"{test_name}_{aggregation}"]
+    res = run_query(project_id, rcode_query, epoch=EPOCH)[f"{test_name}_{aggregation}"]
     results = {"rcodes": {}}
     for _ in timestamps:
         results['rcodes'][_] = None
@@ -338,74 +386,190 @@ def get_response_codes(build_id, test_name, lg_type, start_time, end_time, aggre
     return timestamps, results, users
 
 
-def get_throughput_per_test(build_id, test_name, lg_type, sampler, scope, aggregator, status='all'):
-    scope_addon = ""
-    group_by_addon = ""
-    sampler_piece = ""
-    status_addon = ""
-    project_id = get_project_id(build_id)
-    if scope and scope != 'All':
-        scope_addon = f"and request_name='{scope}'"
-    elif scope != 'All':
-        group_by_addon = "request_name"
-    if sampler:
-        sampler_piece = f"sampler_type='{sampler}' and"
-    if status != 'all':
-        status_addon = f" and status='{status.upper()}'"
-    group_by = f"group by {group_by_addon} time({aggregator})"
-    query = f"select mean(rt) as throughput from (" \
-            f"select sum(total) as rt from {lg_type}_{project_id}..{test_name}_{aggregator} " \
-            f"where {sampler_piece} build_id='{build_id}'{status_addon} {scope_addon} {group_by} " \
-            f")"
-    return round(list(get_client(project_id).query(query)[f"{test_name}_{aggregator}"])[0]["throughput"], 2)
+BATCH_AGGREGATES = {
+    "Min": "percentile(\"min\", 95)",
+    "Median": "percentile(\"median\", 95)",
+    "Max": "percentile(\"max\", 95)",
+    "pct90": "percentile(\"pct90\", 95)",
+    "pct95": "percentile(\"pct95\", 95)",
+    "pct99": "percentile(\"pct99\", 95)",
+    "Throughput": "sum(total)",
+    "1xx": "sum(\"1xx\")",
+    "2xx": "sum(\"2xx\")",
+    "3xx": "sum(\"3xx\")",
+    "4xx": "sum(\"4xx\")",
+    "5xx": "sum(\"5xx\")",
+    "Errors": "count(status)"
+}
 
 
-def get_response_time_per_test(build_id, test_name, lg_type, sampler, scope, aggr, status='all', aggregator="30s"):
-    scope_addon = ""
-    group_by = ""
-    sampler_piece = ""
+def _tag_regex(tag, values):
+    values = "|".join(re.escape(str(value)).replace("/", "\\/") for value in sorted(values))
+    return f"{tag}=~/^({values})$/"
+
+
+def get_batch_series(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler, specs,
+                     timestamps=None, ctx=None):
+    """
+    Compiles (metric, scope, status) specs into one grouped SELECT per status filter and scope kind,
+    sends all statements in a single request and returns {spec: {time: value}} on a shared timeline
+    """
+    ctx = get_context(build_id, ctx)
+    project_id = ctx.project_id
+    if not timestamps:
+        timestamps, _ = get_backend_users(build_id, lg_type, start_time, end_time, aggregation, ctx=ctx)
+    groups = {}
+    for spec in specs:
+        metric, scope, status = spec
+        if metric not in BATCH_AGGREGATES:
+            continue
+        status_addon = " and status='KO'" if metric == "Errors" else \
+            (f" and status='{status.upper()}'" if status != 'all' else "")
+        group = groups.setdefault((status_addon, bool(scope and scope != 'All')),
+                                  {"metrics": set(), "scopes": set(), "specs": []})
+        group["metrics"].add(metric)
+        group["scopes"].add(scope)
+        group["specs"].append(spec)
+    statements = []
+    for (status_addon, per_request), group in groups.items():
+        fields = ", ".join(f"{BATCH_AGGREGATES[metric]} as \"{metric}\"" for metric in sorted(group["metrics"]))
+        scope_addon = f" and {_tag_regex('request_name', group['scopes'])}" if per_request else ""
+        group_by = "request_name, " if per_request else ""
+        statements.append(
+            f"select {fields} from {lg_type}_{project_id}..{test_name}_{aggregation} "
+            f"where time>='{start_time}' and time<='{end_time}' and sampler_type='{sampler}' and "
+            f"build_id='{build_id}'{status_addon}{scope_addon} group by {group_by}time({aggregation})"
+        )
+    results = {spec: dict.fromkeys(timestamps) for spec in specs}
+    for ((_, per_request), group), res in zip(groups.items(), run_batch(project_id, statements, epoch=EPOCH)):
+        for (_, tags), points in res.items():
+            scope = (tags or {}).get("request_name")
+            points = list(points)
+            for metric, spec_scope, status in group["specs"]:
+                if per_request and spec_scope != scope:
+                    continue
+                for point in points:
+                    results[(metric, spec_scope, status)][point['time']] = point[metric]
+    return timestamps, results
+
+
+BENCHMARK_PERCENTILES = ["min", "max", "median", "pct90", "pct95", "pct99"]
+
+
+def benchmark_aggregation(calculation, durations, aggregator=None, resolutions=None):
+    """ Coarsest rollup that still yields the statistic: sums are exact on any rollup, percentiles need points """
+    if aggregator and aggregator != 'auto':
+        return available_aggregation(aggregator, resolutions)
+    if calculation not in BENCHMARK_PERCENTILES:
+        return AGGREGATIONS[-1]
+    candidates = [each for each in AGGREGATIONS if not resolutions or each in resolutions]
+    shortest = min([each for each in durations if each] or [0])
+    for aggregation in reversed(candidates):
+        if shortest / aggregation_seconds(aggregation) >= BENCHMARK_MIN_POINTS:
+            return aggregation
+    return candidates[0]
+
+
+def get_benchmark_values(project_id, test_name, lg_type, durations, calculation, scope, status='all', sampler="",
+                         aggregator=None, resolutions=None):
+    """
+    One query for every build of a (lg_type, test_name) group, grouped by build_id
+    :param durations: - {build_id: test duration in seconds}, used to turn request totals into throughput
+    :param resolutions: - rollups kept for every build of the group, None when none was compacted
+    :return: {build_id: value}
+    """
+    aggregation = benchmark_aggregation(calculation, durations.values(), aggregator, resolutions)
     status_addon = ""
-    project_id = get_project_id(build_id)
+    scope_addon = ""
+    sampler_addon = ""
     if scope and scope != 'All':
-        scope_addon = f"and request_name='{scope}'"
-    elif scope != 'All':
-        group_by += "group by request_name"
-    if aggr in ["min", "max", "median", "pct95", "pct99"]:
-        aggr_func = f"percentile(\"{aggr}\", 95)"
-    else:
-        aggr_func = 'sum(total)'
-
+        scope_addon = f" and request_name='{scope}'"
     if status != 'all':
         status_addon = f" and status='{status.upper()}'"
-    if 'errors' in aggr:
+    if calculation in BENCHMARK_PERCENTILES:
+        aggr_func = f"percentile(\"{calculation}\", 95)"
+    else:
+        aggr_func = "sum(total)"
+    if calculation == 'errors':
         status_addon = " and status='KO'"
     if sampler:
-        sampler_piece = f"sampler_type='{sampler}' and "
-    query = f"select {aggr_func} as rt from {lg_type}_{project_id}..{test_name}_{aggregator} where {sampler_piece}" \
-            f"build_id='{build_id}'{status_addon} {scope_addon} {group_by}"
-    return round(list(get_client(project_id).query(query)[f"{test_name}_{aggregator}"])[0]["rt"], 2)
-
-
-def calculate_auto_aggregation(build_id, test_name, lg_type, start_time, end_time):
-    project_id = get_project_id(build_id)
-    client = get_client(project_id)
-    aggregation = "1s"
-    aggr_list = ["1s", "5s", "30s", "1m", "5m", "10m"]
-    for i in range(len(aggr_list)):
-        aggr = aggr_list[i]
-        query = f"select sum(\"count\") from (select count(pct95) from {lg_type}_{project_id}..{test_name}_{aggr} " \
-                f"where time>='{start_time}' and time<='{end_time}' and build_id='{build_id}' group by time({aggr}))"
-        result = list(client.query(query)[f"{test_name}_{aggr}"])
-        if result:
-            if int(result[0]["sum"]) > MAX_DOTS_ON_CHART and aggregation != "10m":
-                aggregation = aggr_list[i + 1]
-            if int(result[0]["sum"]) == 0 and aggregation != "1s":
-                aggregation = "30s"
-                break
+        sampler_addon = f" and sampler_type='{sampler}'"
+    query = f"select {aggr_func} as rt from {lg_type}_{project_id}..{test_name}_{aggregation} " \
+            f"where {_tag_regex('build_id', durations)}{sampler_addon}{status_addon}{scope_addon} group by build_id"
+    results = {}
+    for (_, tags), points in run_query(project_id, query).items():
+        build_id = tags["build_id"]
+        value = next(points, {}).get("rt")
+        if value is None:
+            continue
+        if calculation == 'throughput':
+            value = value / durations[build_id] if durations.get(build_id) else None
+        results[build_id] = round(value, 2) if value is not None else None
+    return results
+
+
+def aggregation_seconds(aggregation):
+    if aggregation.endswith("m"):
+        return int(aggregation[:-1]) * 60
+    return int(aggregation.rstrip("s"))
+
+
+def available_aggregation(aggregation, resolutions=None):
+    """ The requested rollup, or the finest kept one coarser than it once the build has been compacted """
+    if not resolutions or aggregation in resolutions:
+        return aggregation
+    requested = aggregation_seconds(aggregation)
+    kept = sorted(resolutions, key=aggregation_seconds)
+    for each in kept:
+        if aggregation_seconds(each) >= requested:
+            return each
+    return kept[-1]
+
+
+def calculate_auto_aggregation(build_id, test_name, lg_type, start_time, end_time, ctx=None,
+                               max_points=MAX_DOTS_ON_CHART):
+    ctx = get_context(build_id, ctx)
+    resolutions = tuple(ctx.resolutions or ())
+    return ctx.memoize(("aggregation", test_name, lg_type, start_time, end_time, max_points),
+                       _cached_auto_aggregation, ctx.project_id, build_id, test_name, lg_type, start_time, end_time,
+                       max_points, resolutions)
+
+
+def _cached_auto_aggregation(project_id, build_id, test_name, lg_type, start_time, end_time, max_points,
+                             resolutions=()):
+    key = (build_id, test_name, start_time, end_time, max_points, resolutions)
+    with _aggregation_lock:
+        if key in _aggregation_cache:
+            _aggregation_cache.move_to_end(key)
+            return _aggregation_cache[key]
+    aggregation = _calculate_auto_aggregation(project_id, build_id, test_name, lg_type, start_time, end_time,
+                                              max_points, resolutions)
+    with _aggregation_lock:
+        _aggregation_cache[key] = aggregation
+        while len(_aggregation_cache) > AGGREGATION_CACHE_SIZE:
+            _aggregation_cache.popitem(last=False)
     return aggregation
 
 
-def get_sampler_types(project_id, build_id, test_name, lg_type):
+def _calculate_auto_aggregation(project_id, build_id, test_name, lg_type, start_time, end_time, max_points,
+                                resolutions=()):
+    # series cardinality is probed once on the coarse rollup, points for finer rollups follow from the window
+    probe = "5m"
+    query = f"select count(pct95) from {lg_type}_{project_id}..{test_name}_{probe} " \
+            f"where time>='{start_time}' and time<='{end_time}' and build_id='{build_id}' group by time({probe})"
+    series = max([_["count"] or 0 for _ in run_query(project_id, query)[f"{test_name}_{probe}"]], default=0)
+    if not series:
+        return available_aggregation(AGGREGATIONS[0], resolutions)
+    window = max(str_to_timestamp(end_time) - str_to_timestamp(start_time), 1)
+    for aggregation in AGGREGATIONS:
+        if resolutions and aggregation not in resolutions:
+            continue
+        if series * ceil(window / aggregation_seconds(aggregation)) <= max_points:
+            return aggregation
+    return AGGREGATIONS[-1]
+
+
+def get_sampler_types(project_id, build_id, test_name, lg_type, ctx=None):
+    rollup = available_aggregation("1s", get_context(build_id, ctx).resolutions)
     q_samplers = f"show tag values on {lg_type}_{project_id} with key=sampler_type where build_id='{build_id}'"
-    client = get_client(project_id)
-    return [each["value"] for each in list(client.query(q_samplers)[f"{test_name}_1s"])]
+    return [each["value"] for each in list(run_query(project_id, q_samplers)[f"{test_name}_{rollup}"])]
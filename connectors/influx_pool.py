@@ -0,0 +1,249 @@
+#   Copyright 2021 getcarrier.io
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock, local
+from time import monotonic
+
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ...projects.connectors.influx import get_client
+from ..constants import (INFLUX_POOL_SIZE, INFLUX_POOL_IDLE_TIMEOUT, INFLUX_POOL_HEALTH_INTERVAL,
+                         INFLUX_POOL_MAX_IN_USE, INFLUX_POOL_ACQUIRE_TIMEOUT)
+
+
+_deadline = local()
+
+
+@contextmanager
+def query_deadline(seconds):
+    """ Bounds every Influx query of the calling thread by what is left of seconds from now """
+    previous = getattr(_deadline, "at", None)
+    _deadline.at = monotonic() + seconds
+    try:
+        yield
+    finally:
+        _deadline.at = previous
+
+
+def _remaining():
+    at = getattr(_deadline, "at", None)
+    if at is None:
+        return None
+    left = at - monotonic()
+    if left <= 0:
+        raise TimeoutError("Influx query budget exhausted")
+    return left
+
+
+class InfluxClientPool:
+    """
+    Process-wide pool of keep-alive InfluxDB clients keyed by (project_id, database),
+    at most max_in_use clients are borrowed at once
+    """
+
+    def __init__(self, max_size=INFLUX_POOL_SIZE, idle_timeout=INFLUX_POOL_IDLE_TIMEOUT,
+                 health_interval=INFLUX_POOL_HEALTH_INTERVAL, max_in_use=INFLUX_POOL_MAX_IN_USE,
+                 acquire_timeout=INFLUX_POOL_ACQUIRE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.max_in_use = max_in_use
+        self.acquire_timeout = acquire_timeout
+        self._idle = {}
+        self._lock = Lock()
+        self._in_use = BoundedSemaphore(max_in_use)
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "health_failures": 0, "rejected": 0,
+                       "borrowed": 0, "queries": 0, "query_time": 0.0, "max_query_time": 0.0, "connect_time": 0.0}
+
+    @staticmethod
+    def _close(client):
+        try:
+            client.close()
+        except Exception as exc:  # pylint: disable=W0703
+            log.warning("Failed to close influx client: %s", exc)
+
+    def _evict_expired(self, now):
+        expired = []
+        for key in list(self._idle):
+            alive = []
+            for entry in self._idle[key]:
+                if now - entry["last_used"] > self.idle_timeout:
+                    expired.append(entry["client"])
+                else:
+                    alive.append(entry)
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+        self._stats["evictions"] += len(expired)
+        return expired
+
+    def _evict_oldest(self):
+        key, index = min(
+            ((key, index) for key, entries in self._idle.items() for index in range(len(entries))),
+            key=lambda item: self._idle[item[0]][item[1]]["last_used"]
+        )
+        entry = self._idle[key].pop(index)
+        if not self._idle[key]:
+            del self._idle[key]
+        self._stats["evictions"] += 1
+        return entry["client"]
+
+    def _size(self):
+        return sum(len(entries) for entries in self._idle.values())
+
+    def _is_healthy(self, entry, now):
+        if now - entry["last_checked"] < self.health_interval:
+            return True
+        try:
+            entry["client"].ping()
+            entry["last_checked"] = now
+            return True
+        except Exception as exc:  # pylint: disable=W0703
+            log.warning("Influx client health check failed: %s", exc)
+            with self._lock:
+                self._stats["health_failures"] += 1
+            return False
+
+    def acquire(self, project_id, db=None, timeout=None):
+        """ Borrows a client, waiting for a free slot at most acquire_timeout or timeout when it is shorter """
+        wait = self.acquire_timeout if timeout is None else min(timeout, self.acquire_timeout)
+        if not self._in_use.acquire(timeout=wait):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise TimeoutError(f"All {self.max_in_use} influx clients are in use")
+        try:
+            return self._checkout(project_id, db)
+        except BaseException:
+            self._in_use.release()
+            raise
+
+    def _checkout(self, project_id, db):
+        key = (project_id, db)
+        now = monotonic()
+        with self._lock:
+            to_close = self._evict_expired(now)
+            entry = self._idle[key].pop() if self._idle.get(key) else None
+            if key in self._idle and not self._idle[key]:
+                del self._idle[key]
+        for client in to_close:
+            self._close(client)
+        if entry and not self._is_healthy(entry, now):
+            self._close(entry["client"])
+            entry = None
+        with self._lock:
+            self._stats["hits" if entry else "misses"] += 1
+        if not entry:
+            started = monotonic()
+            client = get_client(project_id, db) if db else get_client(project_id)
+            entry = {"key": key, "client": client, "last_used": now, "last_checked": now}
+            with self._lock:
+                self._stats["connect_time"] += monotonic() - started
+        with self._lock:
+            self._stats["borrowed"] += 1
+        return entry
+
+    def release(self, entry, healthy=True):
+        to_close = []
+        self._in_use.release()
+        with self._lock:
+            self._stats["borrowed"] -= 1
+            if healthy:
+                entry["last_used"] = monotonic()
+                self._idle.setdefault(entry["key"], []).append(entry)
+                while self._size() > self.max_size:
+                    to_close.append(self._evict_oldest())
+            else:
+                to_close.append(entry["client"])
+        for client in to_close:
+            self._close(client)
+
+    @contextmanager
+    def borrow(self, project_id, db=None):
+        timeout = _remaining()
+        entry = self.acquire(project_id, db, timeout)
+        client = entry["client"]
+        # the client is ours until released, its http timeout is narrowed to the budget of the calling thread
+        default_timeout = client._timeout  # pylint: disable=W0212
+        if timeout is not None and default_timeout is not None:
+            timeout = min(timeout, default_timeout)
+        if timeout is not None:
+            client._timeout = timeout  # pylint: disable=W0212
+        started = monotonic()
+        healthy = True
+        try:
+            yield client
+        except OSError:
+            healthy = False
+            raise
+        finally:
+            elapsed = monotonic() - started
+            with self._lock:
+                self._stats["queries"] += 1
+                self._stats["query_time"] += elapsed
+                self._stats["max_query_time"] = max(self._stats["max_query_time"], elapsed)
+            client._timeout = default_timeout  # pylint: disable=W0212
+            self.release(entry, healthy)
+
+    def clear(self):
+        with self._lock:
+            clients = [entry["client"] for entries in self._idle.values() for entry in entries]
+            self._idle = {}
+        for client in clients:
+            self._close(client)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = self._size()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0
+        stats["avg_query_time"] = round(stats["query_time"] / stats["queries"], 6) if stats["queries"] else 0
+        return stats
+
+
+pool = InfluxClientPool()
+
+
+def borrow_client(project_id, db=None):
+    return pool.borrow(project_id, db)
+
+
+def run_query(project_id, query, db=None, **kwargs):
+    with pool.borrow(project_id, db) as client:
+        return client.query(query, **kwargs)
+
+
+def iter_query(project_id, query, chunk_size, db=None, **kwargs):
+    """ Streams a query as result sets of at most chunk_size points, the client is held until it is exhausted """
+    with pool.borrow(project_id, db) as client:
+        yield from client.query(query, chunked=True, chunk_size=chunk_size, **kwargs)
+
+
+def run_batch(project_id, queries, db=None, **kwargs):
+    """ Sends several InfluxQL statements in one request and returns their result sets in order """
+    if not queries:
+        return []
+    with pool.borrow(project_id, db) as client:
+        results = client.query(";".join(queries), **kwargs)
+    if not isinstance(results, list):
+        results = [results]
+    if len(results) != len(queries):
+        raise ValueError(f"Expected {len(queries)} result sets, got {len(results)}")
+    return results
+
+
+def pool_stats():
+    return pool.stats()
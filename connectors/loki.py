@@ -12,34 +12,85 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import ijson
 from requests import get
 from ...shared.constants import LOKI_HOST
+from ..constants import LOKI_PAGE_SIZE, LOKI_MAX_ENTRIES
 
+NANOSECONDS = 1000000000
+
+
+def _fold_issue(issues, line):
+    _values = line.strip().split("\t")
+    _issue = {"count": 1}
+    for _ in _values:
+        if ":" in _:
+            key, value = _[:_.index(':')], _[_.index(':')+1:].strip()
+            if key == 'Error key' and value in issues:
+                issues[value]["count"] += 1
+                continue
+            _issue[key] = value
+    if 'Error key' in _issue and _issue['Error key'] not in issues.keys():
+        issues[_issue['Error key']] = _issue
 
-def get_results(test, int_start_time, int_end_time):
-    url = f"{LOKI_HOST}/loki/api/v1/query_range"
 
+def _stream_page(url, query, start, end, limit):
     data = {
         "direction": "BACKWARD",
-        "limit": 5000,
-        "query": '{filename="/tmp/' + test + '.log"}',
-        "start": int_start_time,
-        "end": int_end_time
+        "limit": limit,
+        "query": query,
+        "start": start,
+        "end": end
     }
-    results = get(url, params=data, headers={"Content-Type": "application/json"}).json()
+    response = get(url, params=data, headers={"Content-Type": "application/json"}, stream=True)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        for ts, line in ijson.items(response.raw, "data.result.item.values.item"):
+            yield int(ts), line
+    finally:
+        response.close()
+
+
+def get_results(test, int_start_time, int_end_time, max_entries=LOKI_MAX_ENTRIES, page_size=LOKI_PAGE_SIZE):
+    """
+    Walks the time range backward page by page, using the oldest timestamp of a page as the cursor,
+    and folds entries into issues as they are parsed. Returns (issues, truncated)
+    """
+    url = f"{LOKI_HOST}/loki/api/v1/query_range"
+    query = '{filename="/tmp/' + test + '.log"}'
+    start = int(int_start_time) * NANOSECONDS
+    cursor = int(int_end_time) * NANOSECONDS
     issues = {}
-    for result in results["data"]["result"]:
-        for value in result['values']:
-            _values = value[1].strip().split("\t")
-            _issue = {"count": 1}
-            _issue_key = ''
-            for _ in _values:
-                if ":" in _:
-                    key, value = _[:_.index(':')], _[_.index(':')+1:].strip()
-                    if key == 'Error key' and value in issues:
-                        issues[value]["count"] += 1
-                        continue
-                    _issue[key] = value
-            if 'Error key' in _issue and _issue['Error key'] not in issues.keys():
-                issues[_issue['Error key']] = _issue
-    return issues
+    seen_at_cursor = set()
+    fetched = 0
+    truncated = False
+    while True:
+        page_size_left = min(page_size, max_entries - fetched + len(seen_at_cursor))
+        received = 0
+        new_entries = 0
+        oldest, seen_at_oldest = None, set()
+        # end is exclusive, so step one nanosecond past the cursor and skip entries already folded
+        for ts, line in _stream_page(url, query, start, cursor + 1, page_size_left):
+            received += 1
+            if ts == cursor and (ts, line) in seen_at_cursor:
+                continue
+            new_entries += 1
+            _fold_issue(issues, line)
+            if oldest is None or ts < oldest:
+                oldest, seen_at_oldest = ts, set()
+            if ts == oldest:
+                seen_at_oldest.add((ts, line))
+        fetched += new_entries
+        if received < page_size_left:
+            return issues, truncated
+        if fetched >= max_entries:
+            return issues, True
+        if not new_entries:
+            # more entries share the cursor timestamp than fit in a page, step past it
+            truncated = True
+            cursor, seen_at_cursor = cursor - 1, set()
+            continue
+        if oldest == cursor:
+            seen_at_oldest |= seen_at_cursor
+        cursor, seen_at_cursor = oldest, seen_at_oldest
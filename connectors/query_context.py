@@ -0,0 +1,91 @@
+#   Copyright 2021 getcarrier.io
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from ..constants import TERMINAL_TEST_STATUSES
+from ..models.api_reports import APIReport
+
+
+class QueryContext:
+    """ Request-scoped build metadata with memoized intermediate query results """
+
+    fields = ("id", "project_id", "name", "lg_type", "start_time", "end_time", "test_status", "resolutions")
+
+    def __init__(self, build_id, report=None):
+        self.build_id = build_id
+        self._meta = None
+        self._memo = {}
+        if report is not None:
+            self._meta = self._snapshot(report)
+
+    @classmethod
+    def _snapshot(cls, report):
+        if isinstance(report, dict):
+            return {key: report.get(key) for key in cls.fields}
+        return {key: getattr(report, key) for key in cls.fields}
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            report = APIReport.query.with_entities(
+                *[getattr(APIReport, key) for key in self.fields]
+            ).filter_by(build_id=self.build_id).first()
+            self._meta = dict(zip(self.fields, report))
+        return self._meta
+
+    @property
+    def report_id(self):
+        return self.meta["id"]
+
+    @property
+    def project_id(self):
+        return self.meta["project_id"]
+
+    @property
+    def test_name(self):
+        return self.meta["name"]
+
+    @property
+    def lg_type(self):
+        return self.meta["lg_type"]
+
+    @property
+    def start_time(self):
+        return self.meta["start_time"]
+
+    @property
+    def end_time(self):
+        return self.meta["end_time"]
+
+    @property
+    def test_status(self):
+        return self.meta["test_status"] or {}
+
+    @property
+    def resolutions(self):
+        return self.meta["resolutions"]
+
+    @property
+    def finished(self):
+        return str(self.test_status.get("status", "")).lower() in TERMINAL_TEST_STATUSES
+
+    def memoize(self, key, func, *args, **kwargs):
+        if key not in self._memo:
+            self._memo[key] = func(*args, **kwargs)
+        return self._memo[key]
+
+
+def get_context(build_id, ctx=None):
+    if ctx is not None and ctx.build_id == build_id:
+        return ctx
+    return QueryContext(build_id)
@@ -0,0 +1,198 @@
+#   Copyright 2021 getcarrier.io
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from json import dump, load
+from math import ceil, exp, log
+from os import path, replace
+from uuid import uuid4
+
+import numpy as np
+
+from ..constants import SKETCH_RELATIVE_ACCURACY, SKETCH_COMPACT_KEYS
+
+SKETCH_PERCENTILES = {"Median": 50, "pct90": 90, "pct95": 95, "pct99": 99}
+SKETCH_DTYPE = np.dtype([("request", "<u2"), ("row", "<u4"), ("bin", "<u2"), ("count", "<u4")])
+
+_LOG_GAMMA = log((1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY))
+
+
+def sketch_bins(values):
+    """ Log bucket of each response time, bucket i holds (gamma^(i-1), gamma^i], values under 1 ms share bucket 0 """
+    return np.ceil(np.log(np.maximum(values, 1.0)) / _LOG_GAMMA).astype("<u2")
+
+
+def bin_values(bins):
+    # within the relative accuracy of every value the bucket holds
+    gamma = exp(_LOG_GAMMA)
+    return 2 * np.power(gamma, bins) / (gamma + 1)
+
+
+def _percentiles(groups, entries, length, percentile):
+    """
+    Percentile of the merged buckets of each group, NaN for groups without entries,
+    only occupied groups and the span of used buckets are laid out
+    """
+    result = np.full(length, np.nan)
+    if not len(entries):
+        return result
+    occupied, groups = np.unique(groups, return_inverse=True)
+    low = int(entries["bin"].min())
+    width = int(entries["bin"].max()) - low + 1
+    counts = np.bincount(groups * width + (entries["bin"].astype(np.int64) - low), weights=entries["count"],
+                         minlength=len(occupied) * width).reshape(len(occupied), width)
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    rank = np.maximum(np.ceil(totals * percentile / 100), 1)
+    positions = np.minimum((cumulative < rank[:, None]).sum(axis=1), width - 1)
+    result[occupied] = np.where(totals > 0, bin_values(positions + low), np.nan)
+    return result
+
+
+def _series(timeline, values):
+    return {ts: (None if np.isnan(value) else round(value, 2)) for ts, value in zip(timeline, values.tolist())}
+
+
+class SketchBuilder:
+    """ Counts response times per (request, row, log bucket), rows are seconds wide and aligned to the epoch """
+
+    def __init__(self, requests, start_ts, seconds):
+        self.requests = {name: i for i, name in enumerate(requests)}
+        self.seconds = seconds
+        self.start = int(start_ts) - int(start_ts) % seconds
+        self._keys = []
+        self._counts = []
+        self._pending = 0
+
+    def add(self, request_name, times, values):
+        index = self.requests.get(request_name)
+        if index is None:
+            return
+        times = np.asarray(times, dtype="<i8")
+        values = np.array([np.nan if _ is None else _ for _ in values], dtype=float)
+        kept = ~np.isnan(values) & (times >= self.start)
+        rows = (times[kept] - self.start) // self.seconds
+        keys = (np.int64(index) << 48) | (rows << 16) | sketch_bins(values[kept]).astype(np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        self._keys.append(keys)
+        self._counts.append(counts)
+        self._pending += len(keys)
+        if self._pending > SKETCH_COMPACT_KEYS:
+            self._compact()
+
+    def _compact(self):
+        if len(self._keys) > 1:
+            keys, inverse = np.unique(np.concatenate(self._keys), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate(self._counts)).astype(np.int64)
+            self._keys, self._counts = [keys], [counts]
+        self._pending = len(self._keys[0]) if self._keys else 0
+
+    def entries(self):
+        """ Entries sorted by request, row and bucket """
+        self._compact()
+        if not self._keys:
+            return np.zeros(0, dtype=SKETCH_DTYPE)
+        keys = self._keys[0]
+        entries = np.empty(len(keys), dtype=SKETCH_DTYPE)
+        entries["request"] = keys >> 48
+        entries["row"] = (keys >> 16) & 0xFFFFFFFF
+        entries["bin"] = keys & 0xFFFF
+        entries["count"] = self._counts[0]
+        return entries
+
+
+class LatencySketches:
+    """
+    Mergeable log-bucket latency histograms of a finished build stored next to its archive:
+    sketch.bin holds SKETCH_DTYPE entries, percentiles of any window are read from the merged buckets
+    """
+
+    def __init__(self, directory):
+        with open(path.join(directory, "sketch.json")) as index_file:
+            index = load(index_file)
+        self.requests = index["requests"]
+        self.start = index["start"]
+        self.seconds = index["seconds"]
+        self._entries = np.memmap(path.join(directory, "sketch.bin"), dtype=SKETCH_DTYPE, mode="r",
+                                  shape=(index["length"],)) if index["length"] else np.zeros(0, dtype=SKETCH_DTYPE)
+        self._offsets = np.searchsorted(self._entries["request"], np.arange(len(self.requests) + 1))
+
+    def _rows(self, start_ts, end_ts):
+        return max(ceil((start_ts - self.start) / self.seconds), 0), max(ceil((end_ts - self.start) / self.seconds), 0)
+
+    def _select(self, indices, start_ts, end_ts):
+        """ Entries of the requests at indices whose rows start within [start_ts, end_ts) """
+        first, last = self._rows(start_ts, end_ts)
+        parts = []
+        for index in indices:
+            part = self._entries[self._offsets[index]:self._offsets[index + 1]]
+            rows = part["row"]
+            parts.append(part[np.searchsorted(rows, first):np.searchsorted(rows, last)])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=SKETCH_DTYPE)
+
+    def _indices(self, requests):
+        if requests is None:
+            return range(len(self.requests))
+        return [self.requests.index(name) for name in requests if name in self.requests]
+
+    def _positions(self, timeline, entries):
+        return np.searchsorted(timeline, self.start + entries["row"].astype(np.int64) * self.seconds,
+                               side="right") - 1
+
+    def series(self, requests, timeline, seconds, percentile):
+        """
+        {ts: value} percentile of the requests (all of them when None) within each chart bucket [ts, ts + seconds),
+        seconds has to be a multiple of the sketch rows
+        """
+        if not timeline:
+            return {}
+        epochs = np.asarray(timeline, dtype="<i8")
+        entries = self._select(self._indices(requests), epochs[0], epochs[-1] + seconds)
+        return _series(timeline, _percentiles(self._positions(epochs, entries), entries, len(timeline), percentile))
+
+    def request_series(self, timeline, seconds, percentile):
+        """ series of every request with data in the chart window, computed in one pass """
+        if not timeline:
+            return {}
+        epochs = np.asarray(timeline, dtype="<i8")
+        entries = self._select(range(len(self.requests)), epochs[0], epochs[-1] + seconds)
+        groups = entries["request"].astype(np.int64) * len(timeline) + self._positions(epochs, entries)
+        values = _percentiles(groups, entries, len(self.requests) * len(timeline), percentile)
+        present = set(entries["request"].tolist())
+        return {name: _series(timeline, values[i * len(timeline):(i + 1) * len(timeline)])
+                for i, name in enumerate(self.requests) if i in present}
+
+    def percentiles(self, requests, start_ts, end_ts, percentiles):
+        """ {percentile: value} of the requests (all of them when None) over [start_ts, end_ts] """
+        entries = self._select(self._indices(requests), start_ts, end_ts + 1)
+        groups = np.zeros(len(entries), dtype=np.int64)
+        return {each: _series([each], _percentiles(groups, entries, 1, each))[each] for each in percentiles}
+
+
+def write_sketches(directory, builder):
+    entries = builder.entries()
+    if not len(entries):
+        return
+    tmp = uuid4().hex
+    entries.tofile(path.join(directory, f"sketch.bin.{tmp}"))
+    with open(path.join(directory, f"sketch.json.{tmp}"), "w") as index_file:
+        dump({"requests": list(builder.requests), "start": builder.start, "seconds": builder.seconds,
+              "length": len(entries)}, index_file)
+    replace(path.join(directory, f"sketch.bin.{tmp}"), path.join(directory, "sketch.bin"))
+    replace(path.join(directory, f"sketch.json.{tmp}"), path.join(directory, "sketch.json"))
+
+
+def load_sketches(directory):
+    if not path.exists(path.join(directory, "sketch.json")):
+        return None
+    return LatencySketches(directory)
@@ -1,3 +1,5 @@
+from os import environ
+
 from ..shared.constants import CURRENT_RELEASE
 
 
@@ -62,3 +64,68 @@ JOB_TYPE_MAPPING = {
     "dast": "dast",
     "sast": "sast",
 }
+
+INFLUX_POOL_SIZE = 32
+INFLUX_POOL_IDLE_TIMEOUT = 300
+INFLUX_POOL_HEALTH_INTERVAL = 60
+# clients borrowed at once, further callers wait up to INFLUX_POOL_ACQUIRE_TIMEOUT seconds for one
+INFLUX_POOL_MAX_IN_USE = 64
+INFLUX_POOL_ACQUIRE_TIMEOUT = 10
+
+AGGREGATIONS = ["1s", "5s", "30s", "1m", "5m", "10m"]
+AGGREGATION_CACHE_SIZE = 1024
+
+TERMINAL_TEST_STATUSES = ("finished", "failed", "canceled", "cancelled", "error")
+
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CHART_CACHE_RUNNING_TTL = 5
+# fetched prefix of a running build chart is kept while viewers keep polling it
+LIVE_PREFIX_TTL = 60
+LIVE_LOCK_STRIPES = 64
+LIVE_STREAM_INTERVAL = 5
+LIVE_STREAM_HEARTBEAT = 15
+LIVE_STREAM_QUEUE_SIZE = 64
+
+LOKI_PAGE_SIZE = 5000
+LOKI_MAX_ENTRIES = 100000
+
+COMPARISON_WORKERS = 8
+# seconds of Influx queries allowed per compared test
+COMPARISON_TIMEOUT = 30
+
+BENCHMARK_MIN_POINTS = 100
+
+ARCHIVE_PATH = environ.get("BACKEND_ARCHIVE_PATH", "/data/backend_performance/archive")
+ARCHIVE_OPEN_LIMIT = 64
+ARCHIVE_SAMPLER = "REQUEST"
+# latency sketches: relative error of a percentile, rows kept per request and raw points read at once
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MAX_ROWS = 1000
+SKETCH_CHUNK_SIZE = 50000
+SKETCH_COMPACT_KEYS = 1000000
+
+DOWNSAMPLE_QUERY_FACTOR = 10
+
+COLUMNAR_MIMETYPE = "application/vnd.carrier.columnar+json"
+
+FINISHED_BUILDS_CACHE_SIZE = 4096
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+QUERY_PLAN_ROWS = 100000
+
+DELETION_BATCH_SIZE = 50
+DELETION_INTERVAL = 0.5
+DELETION_JOBS_KEPT = 100
+DELETION_RECOVERY_INTERVAL = 600
+
+# pct95 growth or throughput drop in percent, error rate growth in points that mark a request as regressed
+BASELINE_REGRESSION_PCT = 10
+BASELINE_ERROR_RATE_DELTA = 1.0
+
+COMPACTION_AGE_DAYS = int(environ.get("BACKEND_COMPACTION_AGE_DAYS", 30))
+COMPACTION_INTERVAL = 3600
+COMPACTION_LIMIT = 1000
+COMPACTION_LOCK_KEY = 4242020
+COMPACTED_AGGREGATIONS = ["1s", "5s"]
@@ -1,11 +1,88 @@
+from sqlalchemy import text, inspect
+
 from ..shared.db_manager import Base, engine
 
 
+def backfill_report_requests(connection):
+    """ Fills api_report_request from api_report.requests for live reports that have no rows there yet """
+    connection.execute(text(
+        "insert into api_report_request (report_id, project_id, test, environment, request_name) "
+        "select distinct r.id, r.project_id, r.name, r.environment, n.request_name from api_report r "
+        "cross join lateral unnest(string_to_array(r.requests, ';')) as n(request_name) "
+        "where n.request_name not in ('', 'All') and r.name is not null and not r.deleted "
+        "and not exists (select 1 from api_report_request q where q.report_id = r.id)"
+    ))
+
+
+def backfill_baseline_requests(connection):
+    """ Fills api_baseline_request from the json summary of baselines that have no typed rows yet """
+    codes = {"onexx": "1xx", "twoxx": "2xx", "threexx": "3xx", "fourxx": "4xx", "fivexx": "5xx"}
+    connection.execute(text(
+        "insert into api_baseline_request (baseline_id, request_name, pct95, throughput, total, ko, error_rate, "
+        f"{', '.join(codes)}) "
+        "select b.id, s.row->>'request_name', (s.row->>'pct95')::float, (s.row->>'throughput')::float, "
+        "(s.row->>'total')::float::int, (s.row->>'ko')::float::int, "
+        "case when (s.row->>'total')::float > 0 "
+        "then round(((s.row->>'ko')::float * 100 / (s.row->>'total')::float)::numeric, 2) else 0 end, "
+        f"{', '.join(f'(s.row->>{code!r})::float::int' for code in codes.values())} "
+        "from api_baseline b cross join lateral unnest(b.summary) as s(row) "
+        "where s.row->>'request_name' is not null "
+        "and not exists (select 1 from api_baseline_request q where q.baseline_id = b.id) "
+        "on conflict do nothing"
+    ))
+
+
+def create_missing_indexes(tables):
+    """ create_all skips indexes of tables that already exist, those are built concurrently to keep writes going """
+    inspector = inspect(engine)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                columns = ", ".join(column.name for column in index.columns)
+                connection.execute(text(
+                    f"create index concurrently if not exists {index.name} on {table.name} ({columns})"
+                ))
+
+
+def add_missing_columns(tables):
+    """ create_all does not alter tables that already exist, columns added to models later are added in place """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"alter table {table.name} add column if not exists {column.name} " \
+                      f"{column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" default {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += " not null"
+                connection.execute(text(ddl))
+
+
 def init_db():
     from .models.api_reports import APIReport
+    from .models.api_report_requests import APIReportRequest
     # from .models.api_tag import APITag
     from .models.api_baseline import APIBaseline
+    from .models.api_baseline_requests import APIBaselineRequest
+    from .models.api_report_diffs import APIReportDiff
     from .models.api_tests import ApiTests
     from .models.api_thresholds import APIThresholds
+    # backfills run once, when create_all makes the table they fill
+    created = {APIReportRequest.__tablename__, APIBaselineRequest.__tablename__} - \
+        set(inspect(engine).get_table_names())
     Base.metadata.create_all(bind=engine)
-
+    add_missing_columns([APIReport.__table__])
+    create_missing_indexes([APIReport.__table__, APIReportRequest.__table__, APIBaseline.__table__,
+                            APIThresholds.__table__, APIBaselineRequest.__table__, APIReportDiff.__table__])
+    with engine.begin() as connection:
+        if APIReportRequest.__tablename__ in created:
+            backfill_report_requests(connection)
+        if APIBaselineRequest.__tablename__ in created:
+            backfill_baseline_requests(connection)
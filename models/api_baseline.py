@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, ARRAY
+from sqlalchemy import Column, Integer, String, JSON, ARRAY, Index
 
 from ...shared.db_manager import Base
 from ...shared.models.abstract_base import AbstractBaseMixin
@@ -6,6 +6,10 @@ from ...shared.models.abstract_base import AbstractBaseMixin
 
 class APIBaseline(AbstractBaseMixin, Base):
     __tablename__ = "api_baseline"
+    __table_args__ = (
+        Index("ix_api_baseline_project_test_env", "project_id", "test", "environment"),
+        Index("ix_api_baseline_project_report", "project_id", "report_id"),
+    )
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, unique=False, nullable=False)
     report_id = Column(Integer, unique=False, nullable=False)
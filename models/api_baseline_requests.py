@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
+
+from ...shared.db_manager import Base
+from ...shared.models.abstract_base import AbstractBaseMixin
+
+
+class APIBaselineRequest(AbstractBaseMixin, Base):
+    __tablename__ = "api_baseline_request"
+    __table_args__ = (
+        Index("ix_api_baseline_request_lookup", "baseline_id", "request_name", unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    baseline_id = Column(Integer, ForeignKey("api_baseline.id", ondelete="CASCADE"), nullable=False)
+    request_name = Column(String, unique=False, nullable=False)
+    pct95 = Column(Float, unique=False)
+    throughput = Column(Float, unique=False)
+    total = Column(Integer, unique=False)
+    ko = Column(Integer, unique=False)
+    error_rate = Column(Float, unique=False)
+    onexx = Column(Integer, unique=False)
+    twoxx = Column(Integer, unique=False)
+    threexx = Column(Integer, unique=False)
+    fourxx = Column(Integer, unique=False)
+    fivexx = Column(Integer, unique=False)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, JSON, ForeignKey
+
+from ...shared.db_manager import Base
+from ...shared.models.abstract_base import AbstractBaseMixin
+
+
+class APIReportDiff(AbstractBaseMixin, Base):
+    __tablename__ = "api_report_diff"
+    id = Column(Integer, primary_key=True)
+    report_id = Column(Integer, ForeignKey("api_report.id", ondelete="CASCADE"), nullable=False, unique=True)
+    baseline_id = Column(Integer, ForeignKey("api_baseline.id", ondelete="CASCADE"), nullable=False, index=True)
+    rows = Column(JSON, nullable=False)
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+
+from ...shared.db_manager import Base
+from ...shared.models.abstract_base import AbstractBaseMixin
+
+
+class APIReportRequest(AbstractBaseMixin, Base):
+    __tablename__ = "api_report_request"
+    __table_args__ = (
+        Index("ix_api_report_request_lookup", "project_id", "test", "environment", "request_name"),
+    )
+    id = Column(Integer, primary_key=True)
+    report_id = Column(Integer, ForeignKey("api_report.id", ondelete="CASCADE"), nullable=False, index=True)
+    project_id = Column(Integer, unique=False, nullable=False)
+    test = Column(String(128), unique=False, nullable=False)
+    environment = Column(String(128), unique=False)
+    request_name = Column(String, unique=False, nullable=False)
+
+    @classmethod
+    def replace_for_report(cls, report, request_names):
+        session = cls.query.session
+        cls.query.filter_by(report_id=report.id).delete(synchronize_session=False)
+        session.bulk_insert_mappings(cls, [
+            dict(report_id=report.id, project_id=report.project_id, test=report.name,
+                 environment=report.environment, request_name=name)
+            for name in sorted(set(request_names)) if name and name != "All"
+        ])
+        session.commit()
@@ -12,7 +12,7 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from sqlalchemy import String, Column, Integer, Float, Text, ARRAY, JSON
+from sqlalchemy import String, Column, Integer, Float, Text, ARRAY, JSON, Index, Boolean, DateTime, text, func
 
 from ...shared.db_manager import Base
 from ...shared.models.abstract_base import AbstractBaseMixin
@@ -20,6 +20,12 @@ from ...shared.models.abstract_base import AbstractBaseMixin
 
 class APIReport(AbstractBaseMixin, Base):
     __tablename__ = "api_report"
+    __table_args__ = (
+        Index("ix_api_report_project_id", "project_id", "id"),
+        Index("ix_api_report_project_name_env", "project_id", "name", "environment", "id"),
+        Index("ix_api_report_project_start_time", "project_id", "start_time", "id"),
+        Index("ix_api_report_project_updated_at", "project_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, unique=False, nullable=False)
@@ -53,6 +59,11 @@ class APIReport(AbstractBaseMixin, Base):
     fivexx = Column(Integer, unique=False)
     requests = Column(Text, unique=False)
     tags = Column(ARRAY(String), default=[])
+    deleted = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+    # rollups still kept in Influx once the build has been compacted, None while everything is kept
+    resolutions = Column(ARRAY(String), nullable=True)
+    # revision marker of listings, bumped by every update of the row
+    updated_at = Column(DateTime, nullable=False, server_default=text("now()"), onupdate=func.now())
     test_status = Column(
         JSON,
         default={
@@ -63,6 +74,7 @@ class APIReport(AbstractBaseMixin, Base):
     )
 
     def to_json(self, exclude_fields: tuple = ()) -> dict:
-        json_dict = super().to_json(exclude_fields=("requests",))
+        json_dict = super().to_json(exclude_fields=("requests", "updated_at"))
         json_dict["requests"] = self.requests.split(";")
+        json_dict["updated_at"] = self.updated_at.isoformat() if self.updated_at else None
         return json_dict
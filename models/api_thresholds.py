@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, Index
 
 from ...shared.db_manager import Base
 from ...shared.models.abstract_base import AbstractBaseMixin
@@ -6,6 +6,9 @@ from ...shared.models.abstract_base import AbstractBaseMixin
 
 class APIThresholds(AbstractBaseMixin, Base):
     __tablename__ = "api_thresholds"
+    __table_args__ = (
+        Index("ix_api_thresholds_project_test_env", "project_id", "test", "environment"),
+    )
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, unique=False, nullable=False)
     test = Column(String, unique=False, nullable=False)
@@ -23,7 +23,8 @@ from pylon.core.tools import log  # pylint: disable=E0611,E0401
 from pylon.core.tools import module  # pylint: disable=E0611,E0401
 
 from ..shared.utils.api_utils import add_resource_to_api
-from .rpc_worker import backend_results_or_404
+from .rpc_worker import (backend_results_or_404, backend_performance_stats, backend_query_plan_check,
+                         backend_compact_builds)
 
 from .init_db import init_db
 
@@ -45,12 +46,21 @@ class Module(module.ModuleModel):
         add_resource_to_api(self.context.api, TestApiBackend, "/tests/<int:project_id>/backend/<string:test_id>")
         from .api.thresholds import BackendThresholdsAPI
         add_resource_to_api(self.context.api, BackendThresholdsAPI, "/thresholds/<int:project_id>/backend")
+        from .api.threshold_results import ThresholdResultsAPI
+        add_resource_to_api(self.context.api, ThresholdResultsAPI,
+                            "/thresholds/<int:project_id>/backend/<string:build_id>")
         from .api.baseline import BaselineAPI
         add_resource_to_api(self.context.api, BaselineAPI, "/baseline/<int:project_id>")
+        from .api.baseline_diff import BaselineDiffAPI
+        add_resource_to_api(self.context.api, BaselineDiffAPI, "/baseline/<int:project_id>/diff")
         from .api.reports import ReportAPI
         add_resource_to_api(self.context.api, ReportAPI, "/reports/<int:project_id>")
         from .api.charts import ReportChartsAPI
         add_resource_to_api(self.context.api, ReportChartsAPI, "/chart/<string:source>/<string:target>")
+        from .api.chart_stream import ChartStreamAPI
+        add_resource_to_api(self.context.api, ChartStreamAPI, "/chart/stream")
+        from .api.report_deletion import ReportDeletionAPI
+        add_resource_to_api(self.context.api, ReportDeletionAPI, "/reports/<int:project_id>/deletions/<string:job_id>")
         from .api.report_status import ReportStatusAPI
         add_resource_to_api(self.context.api, ReportStatusAPI, "/reports/<int:project_id>/<int:report_id>/status")
         from .api.environments import EnvironmentsAPI
@@ -59,7 +69,17 @@ class Module(module.ModuleModel):
         add_resource_to_api(self.context.api, RequestsAPI, "/requests/<int:project_id>")
 
         self.context.rpc_manager.register_function(backend_results_or_404, name='backend_results_or_404')
+        self.context.rpc_manager.register_function(backend_performance_stats, name='backend_performance_stats')
+        self.context.rpc_manager.register_function(backend_query_plan_check, name='backend_query_plan_check')
+        self.context.rpc_manager.register_function(backend_compact_builds, name='backend_compact_builds')
+
+        from .utils.compaction import start_compaction
+        start_compaction(self.context.app)
+        from .utils.deletion import start_deletion_recovery
+        start_deletion_recovery(self.context.app)
 
     def deinit(self):  # pylint: disable=R0201
         """ De-init module """
         log.info("De-initializing Backend_performance")
+        from .connectors.influx_pool import pool
+        pool.clear()
@@ -1,5 +1,22 @@
 from .models.api_reports import APIReport
+from .connectors.influx_pool import pool_stats
+from .utils.charts_utils import chart_cache
+from .utils.live_stream import live_hub
+from .utils.query_plans import check_query_plans
+from .utils.compaction import compact_builds
 
 
 def backend_results_or_404(run_id):
-    return APIReport.query.get_or_404(run_id)
\ No newline at end of file
+    return APIReport.query.filter_by(id=run_id, deleted=False).first_or_404()
+
+
+def backend_performance_stats():
+    return {"influx_pool": pool_stats(), "chart_cache": chart_cache.stats(), "live": live_hub.stats()}
+
+
+def backend_query_plan_check():
+    return check_query_plans()
+
+
+def backend_compact_builds():
+    return {"compacted": compact_builds()}
@@ -0,0 +1,68 @@
+import warnings
+from base64 import b64decode
+
+import numpy as np
+
+from ..utils.report_utils import lttb_indices, pack_chart, columnar_chart
+
+START = 1609459200
+
+
+def _chart(datasets, length):
+    timeline = [START + i for i in range(length)]
+    return {"labels": [str(_) for _ in timeline],
+            "datasets": [{"label": f"series_{i}", "data": data} for i, data in enumerate(datasets)]}, timeline
+
+
+def test_lttb_keeps_endpoints_and_threshold():
+    values = np.sin(np.linspace(0, 20, 1000)).tolist()
+    kept = lttb_indices(values, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert (np.diff(kept) > 0).all()
+
+
+def test_lttb_skips_nulls():
+    values = [None, 1, None, 3, 2, None, 5, 4, None]
+    kept = lttb_indices(values, 3).tolist()
+    assert kept[0] == 1 and kept[-1] == 7
+    assert all(values[_] is not None for _ in kept)
+
+
+def test_pack_chart_caps_points_whatever_the_number_of_datasets():
+    rng = np.random.default_rng(0)
+    datasets = [[None if rng.random() < 0.1 else float(value) for value in rng.random(2000) * (i + 1)]
+                for i in range(40)]
+    datasets.append([None] * 2000)
+    chart, timeline = _chart(datasets, 2000)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        packed = pack_chart(chart, timeline, downsample=300, epochs=True)
+    assert len(packed["labels"]) == len(packed["timeline"]) == 300
+    assert packed["timeline"][0] == START and packed["timeline"][-1] == START + 1999
+    assert all(len(each["data"]) == 300 for each in packed["datasets"])
+
+
+def test_pack_chart_keeps_dips_of_a_low_series():
+    length = 1000
+    # the other series sits at the top of its range where the dip happens
+    high = [100.0] * length
+    high[0] = 0.0
+    low = [10.0] * length
+    low[500] = 0.0
+    chart, timeline = _chart([high, low], length)
+    packed = pack_chart(chart, timeline, downsample=20, epochs=True)
+    assert START + 500 in packed["timeline"]
+
+
+def test_columnar_chart_null_bitmask():
+    chart, timeline = _chart([[1.0, None, 3.0, None, 5.0], [1.0, 2.0, 3.0, 4.0, 5.0]], 5)
+    payload = columnar_chart(chart, timeline)
+    assert payload["length"] == 5
+    assert payload["timeline"] == {"start": START, "deltas": [[1, 4]]}
+    nulls = np.unpackbits(np.frombuffer(b64decode(payload["datasets"][0]["nulls"]), dtype=np.uint8),
+                          bitorder="little")[:5]
+    assert nulls.tolist() == [0, 1, 0, 1, 0]
+    assert payload["datasets"][1]["nulls"] is None
+    values = np.frombuffer(b64decode(payload["datasets"][0]["values"]), dtype="<f4")
+    assert values.tolist() == [1.0, 0.0, 3.0, 0.0, 5.0]
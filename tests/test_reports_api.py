@@ -0,0 +1,34 @@
+from datetime import datetime
+from json import dumps
+from unittest import mock
+
+from flask import Flask
+
+from ..api import reports
+from ..models.api_reports import APIReport
+
+REPORT = {
+    "build_id": "build_1", "test_name": "test", "lg_type": "jmeter", "missed": 0,
+    "test_status": {"status": "Pending...", "percentage": 0, "description": ""}, "duration": 60, "vusers": 10,
+    "start_time": "2021-01-01T00:00:00.000Z", "environment": "demo", "type": "demo", "release_id": None,
+    "test_id": "uid"
+}
+
+
+def _stored(report):
+    # the database fills the key and the revision marker on insert
+    report.id = 1
+    report.updated_at = datetime(2021, 1, 1, 12, 30)
+
+
+def test_post_returns_serializable_report():
+    app = Flask(__name__)
+    with app.test_request_context(json=REPORT), \
+            mock.patch.object(APIReport, "insert", autospec=True, side_effect=_stored), \
+            mock.patch.object(reports, "Statistic"), \
+            mock.patch.object(reports.ReportAPI, "rpc", create=True) as rpc:
+        rpc.project_get_or_404.return_value.id = 1
+        report = reports.ReportAPI().post(1)
+    assert report["updated_at"] == "2021-01-01T12:30:00"
+    assert report["build_id"] == "build_1"
+    dumps(report)
@@ -0,0 +1,121 @@
+from sqlalchemy.dialects.postgresql import insert
+
+from ..constants import BASELINE_REGRESSION_PCT, BASELINE_ERROR_RATE_DELTA
+from ..connectors.influx import get_aggregated_test_results
+from ..connectors.query_context import QueryContext
+from ..models.api_baseline import APIBaseline
+from ..models.api_baseline_requests import APIBaselineRequest
+from ..models.api_report_diffs import APIReportDiff
+
+CODE_COLUMNS = {"1xx": "onexx", "2xx": "twoxx", "3xx": "threexx", "4xx": "fourxx", "5xx": "fivexx"}
+DIFF_METRICS = ["pct95", "throughput", "error_rate", "1xx", "2xx", "3xx", "4xx", "5xx"]
+
+
+def summary_rows(report):
+    """ api_comparison rows of a report, one per request_name and one for All """
+    results = get_aggregated_test_results(report.name, report.build_id, ctx=QueryContext(report.build_id, report))
+    return list(results[0]) if results else []
+
+
+def summary_values(row):
+    total, ko = row.get("total") or 0, row.get("ko") or 0
+    values = {"pct95": row.get("pct95"), "throughput": row.get("throughput"), "total": total, "ko": ko,
+              "error_rate": round(ko / total * 100, 2) if total else 0}
+    for code in CODE_COLUMNS:
+        values[code] = row.get(code)
+    return values
+
+
+def store_baseline_requests(baseline_id, rows):
+    session = APIBaselineRequest.query.session
+    APIBaselineRequest.query.filter_by(baseline_id=baseline_id).delete(synchronize_session=False)
+    mappings = []
+    for row in rows:
+        values = summary_values(row)
+        mapping = dict(baseline_id=baseline_id, request_name=row["request_name"], pct95=values["pct95"],
+                       throughput=values["throughput"], total=values["total"], ko=values["ko"],
+                       error_rate=values["error_rate"])
+        mapping.update({column: values[code] for code, column in CODE_COLUMNS.items()})
+        mappings.append(mapping)
+    session.bulk_insert_mappings(APIBaselineRequest, mappings)
+    session.commit()
+
+
+def _baseline_values(baseline_id):
+    rows = APIBaselineRequest.query.with_entities(
+        APIBaselineRequest.request_name, APIBaselineRequest.pct95, APIBaselineRequest.throughput,
+        APIBaselineRequest.error_rate, *[getattr(APIBaselineRequest, column) for column in CODE_COLUMNS.values()]
+    ).filter_by(baseline_id=baseline_id).all()
+    values = {}
+    for row in rows:
+        values[row.request_name] = {"pct95": row.pct95, "throughput": row.throughput, "error_rate": row.error_rate}
+        values[row.request_name].update({code: getattr(row, column) for code, column in CODE_COLUMNS.items()})
+    return values
+
+
+def _change(current, base):
+    if current is None or base is None:
+        return None, None
+    delta = current - base
+    return round(delta, 2), round(delta / base * 100, 2) if base else None
+
+
+def _is_regression(entry):
+    pct95, throughput, errors = entry["pct95"]["percent"], entry["throughput"]["percent"], \
+        entry["error_rate"]["delta"]
+    return (pct95 is not None and pct95 > BASELINE_REGRESSION_PCT) or \
+        (throughput is not None and throughput < -BASELINE_REGRESSION_PCT) or \
+        (errors is not None and errors > BASELINE_ERROR_RATE_DELTA)
+
+
+def compute_diff(rows, baseline_id):
+    """ Per request_name current, baseline, delta and percent change, regressions first by pct95 change """
+    baseline = _baseline_values(baseline_id)
+    diff = []
+    for row in rows:
+        current, base = summary_values(row), baseline.get(row["request_name"])
+        entry = {"request_name": row["request_name"], "in_baseline": base is not None}
+        for metric in DIFF_METRICS:
+            delta, percent = _change(current[metric], base[metric]) if base else (None, None)
+            entry[metric] = {"current": current[metric], "baseline": base[metric] if base else None,
+                             "delta": delta, "percent": percent}
+        entry["regression"] = _is_regression(entry)
+        diff.append(entry)
+    diff.sort(key=lambda entry: (not entry["regression"], -(entry["pct95"]["percent"] or 0)))
+    return diff
+
+
+def _baseline_of(report):
+    return APIBaseline.query.with_entities(APIBaseline.id, APIBaseline.report_id).filter_by(
+        project_id=report.project_id, test=report.name, environment=report.environment
+    ).first()
+
+
+def store_report_diff(report, rows=None):
+    """ Computes the diff of a report against the baseline of its environment and caches it """
+    baseline = _baseline_of(report)
+    if not baseline:
+        return None
+    if rows is None:
+        rows = summary_rows(report)
+    diff = compute_diff(rows, baseline.id)
+    # concurrent updates of one report race for the unique report_id, the last one wins
+    statement = insert(APIReportDiff.__table__).values(report_id=report.id, baseline_id=baseline.id, rows=diff)
+    session = APIReportDiff.query.session
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[APIReportDiff.report_id],
+        set_={"baseline_id": statement.excluded.baseline_id, "rows": statement.excluded.rows}
+    ))
+    session.commit()
+    return {"baseline_report_id": baseline.report_id, "rows": diff}
+
+
+def get_report_diff(report):
+    baseline = _baseline_of(report)
+    if not baseline:
+        return None
+    cached = APIReportDiff.query.with_entities(APIReportDiff.baseline_id, APIReportDiff.rows).filter_by(
+        report_id=report.id).first()
+    if cached and cached.baseline_id == baseline.id:
+        return {"baseline_report_id": baseline.report_id, "rows": cached.rows}
+    return store_report_diff(report)
@@ -1,34 +1,360 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from json import dumps
+from threading import Lock
+from time import monotonic, time
+from uuid import uuid4
+
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ..constants import (CHART_CACHE_MAX_BYTES, CHART_CACHE_RUNNING_TTL, COMPARISON_WORKERS, COMPARISON_TIMEOUT,
+                         ARCHIVE_SAMPLER, DOWNSAMPLE_QUERY_FACTOR, FINISHED_BUILDS_CACHE_SIZE, LIVE_PREFIX_TTL,
+                         LIVE_LOCK_STRIPES, AGGREGATIONS, SKETCH_MAX_ROWS, SKETCH_CHUNK_SIZE)
 from ..models.api_reports import APIReport
 from ..connectors.influx import (get_backend_requests, get_hits_tps, average_responses, get_build_data, get_tps,
                                  get_hits, get_errors, get_response_codes, get_backend_users,
-                                 get_throughput_per_test, get_response_time_per_test)
+                                 get_batch_series, get_benchmark_values, available_aggregation, aggregation_seconds,
+                                 iter_response_times)
+from ..connectors.influx_pool import query_deadline
 from ..connectors.loki import get_results
-from .report_utils import calculate_proper_timeframe, chart_data, create_dataset, comparison_data
-from ...shared.constants import str_to_timestamp
+from ..connectors.archive import ARCHIVE_METRICS, archive_path, load_archive, write_archive, delete_archive
+from ..connectors.sketches import SKETCH_PERCENTILES, SketchBuilder, write_sketches
+from ..connectors.query_context import QueryContext
+from .report_utils import calculate_proper_timeframe, chart_data, create_dataset, comparison_data, pack_chart
+from .utils import run_in_app_context, encode_cursor, decode_cursor
+from .http_utils import make_etag, encode_json
+from ...shared.constants import str_to_timestamp, MAX_DOTS_ON_CHART
+
+
+class ChartCache:
+    """ LRU cache of chart payloads bounded by an approximate byte budget, entries may carry a TTL """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._builds = {}
+        self._bytes = 0
+        self._lock = Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        value, size, expires = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._builds.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._builds[key[0]]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[2] is not None and entry[2] < monotonic():
+                self._drop(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None, size=None):
+        if size is None:
+            # the size of the body the payload is sent as
+            size = len(encode_json(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, monotonic() + ttl if ttl else None)
+            self._builds.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, build_id):
+        with self._lock:
+            for key in list(self._builds.get(build_id, ())):
+                self._drop(key)
+                self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0
+        return stats
+
+
+chart_cache = ChartCache(CHART_CACHE_MAX_BYTES)
+comparison_pool = ThreadPoolExecutor(max_workers=COMPARISON_WORKERS, thread_name_prefix="backend_comparison")
+archive_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backend_archive")
+# sketches read every raw point of a build, they are built aside so that archive exports are not held up
+sketch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backend_sketch")
+
+
+_finished_builds = OrderedDict()
+_finished_lock = Lock()
+
+
+def _build_state(build_id):
+    """
+    (status, start_time, end_time, resolutions, finished) of a build,
+    finished builds are remembered without a query until their caches are invalidated
+    """
+    with _finished_lock:
+        if build_id in _finished_builds:
+            _finished_builds.move_to_end(build_id)
+            return _finished_builds[build_id], None
+    ctx = QueryContext(build_id)
+    state = (ctx.test_status.get("status"), ctx.start_time, ctx.end_time, ctx.resolutions, ctx.finished)
+    if ctx.finished:
+        with _finished_lock:
+            _finished_builds[build_id] = state
+            while len(_finished_builds) > FINISHED_BUILDS_CACHE_SIZE:
+                _finished_builds.popitem(last=False)
+    return state, ctx
+
+
+def chart_etag(source, target, args):
+    """
+    ETag of a chart computed from build metadata and args only: strong for finished builds,
+    weak and bound to the running cache window otherwise. Returns the context loaded on the way, if any
+    """
+    if not args.get('build_id'):
+        return None, None
+    (status, start_time, end_time, resolutions, finished), ctx = _build_state(args['build_id'])
+    if finished:
+        return make_etag(args['build_id'], status, start_time, end_time, resolutions, source, target, args), ctx
+    return make_etag(args['build_id'], status, end_time, source, target, args,
+                     int(time() // CHART_CACHE_RUNNING_TTL), weak=True), ctx
+
+
+def cached_chart(source, target, func, args, ctx=None):
+    if not args.get('build_id'):
+        return func(args)
+    key = (args['build_id'], source, target, dumps(args, sort_keys=True, default=str))
+    result = chart_cache.get(key)
+    if result is None:
+        ctx = ctx or QueryContext(args['build_id'])
+        result = func(args, ctx=ctx)
+        chart_cache.set(key, result, ttl=None if ctx.finished else CHART_CACHE_RUNNING_TTL)
+    return result
+
+
+_live_locks = [Lock() for _ in range(LIVE_LOCK_STRIPES)]
+LIVE_VOLATILE_ARGS = ("since", "format", "downsample", "start_time", "end_time", "low_value", "high_value")
+
+
+def _live_args(args, **overrides):
+    # the live prefix always spans the whole run as plain json with its epoch timeline
+    live = dict(args, since=None, format="", downsample=0, epochs=True, low_value=0, high_value=100,
+                start_time="", end_time="")
+    live.update(overrides)
+    return live
+
+
+def _live_fetch(func, args, ctx, aggregation, start_time=""):
+    chart = func(_live_args(args, aggregator=aggregation, start_time=start_time), ctx=ctx)
+    return {"labels": chart.get("labels", []), "datasets": chart.get("datasets", []),
+            "timeline": chart.get("timeline", [])}
+
+
+def _merge_tail(entry, tail):
+    """ Replaces the points of entry from the first tail bucket on, datasets new in the tail are null-padded """
+    keep = bisect_left(entry["timeline"], tail["timeline"][0]) if tail["timeline"] else len(entry["timeline"])
+    padding = [None] * len(tail["timeline"])
+    data = {each["label"]: each["data"] for each in tail["datasets"]}
+    datasets = [dict(each, data=each["data"][:keep] + data.pop(each["label"], padding))
+                for each in entry["datasets"]]
+    datasets.extend(dict(each, data=[None] * keep + each["data"])
+                    for each in tail["datasets"] if each["label"] in data)
+    return dict(entry, labels=entry["labels"][:keep] + tail["labels"], datasets=datasets,
+                timeline=entry["timeline"][:keep] + tail["timeline"], revision=entry["revision"] + 1,
+                refreshed=monotonic())
+
+
+def _live_entry(key, func, args, ctx, max_age=CHART_CACHE_RUNNING_TTL):
+    """
+    Whole-run chart of a build kept between polls: only the buckets from the last, possibly incomplete,
+    one on are queried again. A new generation starts when auto aggregation outgrows the chart
+    """
+    entry = chart_cache.get(key)
+    if entry is not None and (ctx.finished or monotonic() - entry["refreshed"] < max_age):
+        return entry
+    if entry is not None and entry["timeline"]:
+        start_time = datetime.fromtimestamp(entry["timeline"][-1]).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        entry = _merge_tail(entry, _live_fetch(func, args, ctx, entry["aggregation"], start_time))
+        if args.get('aggregator', 'auto') == 'auto' and len(entry["timeline"]) > MAX_DOTS_ON_CHART:
+            entry = None
+    else:
+        entry = None
+    if entry is None:
+        _, _, aggregation = _timeframe(_live_args(args), ctx=ctx)
+        entry = dict(_live_fetch(func, args, ctx, aggregation), aggregation=aggregation, generation=uuid4().hex[:8],
+                     revision=0, refreshed=monotonic())
+    chart_cache.set(key, entry, ttl=None if ctx.finished else LIVE_PREFIX_TTL,
+                    size=len(entry["timeline"]) * (len(entry["datasets"]) + 1) * 16)
+    return entry
+
+
+def live_args_key(args):
+    """ Args that shape the whole-run chart, the prefix is shared by every viewer of the same chart """
+    return dumps({key: value for key, value in args.items() if key not in LIVE_VOLATILE_ARGS},
+                 sort_keys=True, default=str)
+
+
+def incremental_chart(source, target, func, args, ctx=None, max_age=CHART_CACHE_RUNNING_TTL):
+    """
+    Points of a whole-run chart from the since cursor on. The last point of a running build may still change,
+    it is sent again with the next poll and replaces the client copy. reset marks a payload holding the full chart
+    """
+    ctx = _context(args, ctx)
+    key = (args['build_id'], source, target, "live", live_args_key(args))
+    with _live_locks[hash(key) % LIVE_LOCK_STRIPES]:
+        entry = _live_entry(key, func, args, ctx, max_age)
+    try:
+        generation, last = decode_cursor(args['since']) if args.get('since') else (None, None)
+    except (TypeError, ValueError):
+        generation, last = None, None
+    reset = generation != entry["generation"] or last is None
+    start = 0 if reset else bisect_left(entry["timeline"], last)
+    timeline = entry["timeline"][start:]
+    chart = pack_chart({"labels": entry["labels"][start:],
+                        "datasets": [dict(each, data=each["data"][start:]) for each in entry["datasets"]]},
+                       timeline, columnar=args.get('format') == 'columnar')
+    chart.update({
+        "cursor": encode_cursor([entry["generation"], entry["timeline"][-1] if entry["timeline"] else None]),
+        "reset": reset,
+        "revision": entry["revision"],
+        "partial": not ctx.finished,
+        "aggregation": entry["aggregation"]
+    })
+    return chart
+
+
+def invalidate_chart_cache(build_id):
+    chart_cache.invalidate(build_id)
+    with _finished_lock:
+        _finished_builds.pop(build_id, None)
+
+
+def _context(args, ctx=None):
+    if ctx is not None:
+        return ctx
+    return QueryContext(args['build_id'])
+
+
+def _max_points(args):
+    # downsampled charts are queried on a finer rollup and reduced to the requested points afterwards
+    return MAX_DOTS_ON_CHART * DOWNSAMPLE_QUERY_FACTOR if args.get('downsample') else MAX_DOTS_ON_CHART
 
 
-def _timeframe(args, time_as_ts=False):
-    end_time = args['end_time']
+def _chart_options(args):
+    return {"downsample": args.get('downsample', 0), "columnar": args.get('format') == 'columnar',
+            "epochs": args.get('epochs', False)}
+
+
+def _timeframe(args, time_as_ts=False, ctx=None, archive=None):
+    ctx = _context(args, ctx)
+    start_time = args['start_time'] or ctx.start_time
+    end_time = args['end_time'] or ctx.end_time
+    low_value = args.get('low_value', 0)
     high_value = args.get('high_value', 100)
+    aggregation = args.get('aggregator', 'auto')
     if not end_time:
         end_time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         high_value = 100
-    return calculate_proper_timeframe(args['build_id'], args['test_name'], args['lg_type'], args.get('low_value', 0),
-                                      high_value, args['start_time'], end_time, args.get('aggregator', 'auto'),
-                                      time_as_ts=time_as_ts)
+    if archive is not None and aggregation == 'auto' and not args.get('downsample') \
+            and float(low_value) == 0 and float(high_value) == 100:
+        # the archive was exported at the auto aggregation of the whole run
+        aggregation = archive.aggregation
+    elif aggregation != 'auto':
+        aggregation = available_aggregation(aggregation, ctx.resolutions)
+    return calculate_proper_timeframe(args['build_id'], args['test_name'], args['lg_type'], low_value,
+                                      high_value, start_time, end_time, aggregation,
+                                      time_as_ts=time_as_ts, ctx=ctx, max_points=_max_points(args))
+
+
+def _archived(args, ctx):
+    """ Archive of a finished build if it holds the requested sampler and status """
+    if not ctx.finished or args.get('status', 'all') != 'all':
+        return None
+    try:
+        archive = load_archive(ctx.project_id, args['build_id'])
+    except (OSError, ValueError) as exc:
+        log.warning("Failed to open archive of %s: %s", args['build_id'], exc)
+        return None
+    if archive is None or archive.sampler != args.get('sampler'):
+        return None
+    return archive
+
+
+def _archived_timeframe(args, ctx):
+    """ Resolves the chart window and, when the archive can serve it, the archive with its slice """
+    archive = _archived(args, ctx)
+    start_time, end_time, aggregation = _timeframe(args, ctx=ctx, archive=archive)
+    if archive is not None and archive.aggregation == aggregation:
+        start_ts, end_ts = str_to_timestamp(start_time), str_to_timestamp(end_time)
+        if archive.covers(start_ts, end_ts):
+            return start_time, end_time, aggregation, archive, archive.window(start_ts, end_ts)
+    # the archive may have been exported at a rollup that compaction dropped since
+    return start_time, end_time, available_aggregation(aggregation, ctx.resolutions), None, None
+
+
+def _sketched(args, ctx, aggregation=None):
+    """ Latency sketches of a finished build whose rows fit into the buckets of aggregation """
+    archive = _archived(args, ctx)
+    sketches = archive.sketches if archive is not None else None
+    if sketches is None or (aggregation and aggregation_seconds(aggregation) % sketches.seconds):
+        return None
+    return sketches
+
+
+def _sketched_archive(project_id, build_id):
+    """ Archive of a build when latency sketches were written next to it """
+    try:
+        archive = load_archive(project_id, build_id)
+    except (OSError, ValueError) as exc:
+        log.warning("Failed to open archive of %s: %s", build_id, exc)
+        return None
+    return archive if archive is not None and archive.sketches is not None else None
 
 
-def _query_only(args, query_func):
-    start_time, end_time, aggregation = _timeframe(args)
-    timeline, results, users = query_func(args['build_id'], args['test_name'], args['lg_type'],
-                                          start_time, end_time, aggregation,
-                                          sampler=args['sampler'], status=args["status"])
-    return chart_data(timeline, users, results)
+def _sketch_scope(scope):
+    return None if scope in ("", "All") else [scope]
+
+
+def _query_only(args, query_func, ctx=None, archived=None, sketched=None):
+    ctx = _context(args, ctx)
+    start_time, end_time, aggregation, archive, window = _archived_timeframe(args, ctx)
+    sketches = _sketched(args, ctx, aggregation) if sketched is not None else None
+    if archive is not None and archived is not None:
+        timeline, users = archive.timeline(window), {"users": archive.series("", "Users", window)}
+        results = sketched(sketches, timeline, aggregation_seconds(aggregation)) if sketches is not None \
+            else archived(archive, window)
+    elif sketches is not None:
+        timeline, users = get_backend_users(args['build_id'], args['lg_type'], start_time, end_time, aggregation,
+                                            ctx=ctx)
+        results = sketched(sketches, timeline, aggregation_seconds(aggregation))
+    else:
+        timeline, results, users = query_func(args['build_id'], args['test_name'], args['lg_type'],
+                                              start_time, end_time, aggregation,
+                                              sampler=args['sampler'], status=args["status"], ctx=ctx)
+    return chart_data(timeline, users, results, **_chart_options(args))
 
 
 def get_tests_metadata(tests):
-    tests_meta = APIReport.query.filter(APIReport.id.in_(tests)).order_by(APIReport.id.asc()).all()
+    tests_meta = APIReport.query.filter(
+        APIReport.id.in_(tests), APIReport.deleted.is_(False)
+    ).order_by(APIReport.id.asc()).all()
     users_data = {}
     responses_data = {}
     errors_data = {}
@@ -46,35 +372,56 @@ def get_tests_metadata(tests):
     return labels, rps_data, errors_data, users_data, responses_data
 
 
-def requests_summary(args):
-    return _query_only(args, get_backend_requests)
+def requests_summary(args, ctx=None):
+    return _query_only(args, get_backend_requests, ctx,
+                       lambda archive, window: {name: archive.series(name, "pct95", window)
+                                                for name in archive.requests},
+                       lambda sketches, timeline, seconds: sketches.request_series(timeline, seconds, 95))
 
 
-def requests_hits(args):
-    return _query_only(args, get_hits_tps)
+def requests_hits(args, ctx=None):
+    return _query_only(args, get_hits_tps, ctx,
+                       lambda archive, window: {"throughput": archive.series("All", "Throughput", window)})
 
 
-def avg_responses(args):
-    return _query_only(args, average_responses)
+def avg_responses(args, ctx=None):
+    return _query_only(args, average_responses, ctx,
+                       lambda archive, window: {"responses": archive.series("All", "pct95", window)},
+                       lambda sketches, timeline, seconds: {"responses": sketches.series(None, timeline, seconds, 95)})
 
 
-def summary_table(args):
-    start_time, end_time, aggregation = _timeframe(args)
-    return get_build_data(args['build_id'], args['test_name'], args['lg_type'], start_time, end_time, args['sampler'])
+def summary_table(args, ctx=None):
+    ctx = _context(args, ctx)
+    start_time, end_time, aggregation = _timeframe(args, ctx=ctx)
+    rows = get_build_data(args['build_id'], args['test_name'], args['lg_type'], start_time, end_time, args['sampler'],
+                          ctx=ctx)
+    sketches = _sketched(args, ctx)
+    if sketches is not None and (float(args.get('low_value', 0)) != 0 or float(args.get('high_value', 100)) != 100):
+        # api_comparison holds whole-run percentiles, a narrower window is answered from the sketches
+        start_ts, end_ts = str_to_timestamp(start_time), str_to_timestamp(end_time)
+        for row in rows:
+            values = sketches.percentiles(_sketch_scope(row.get('request_name', '')), start_ts, end_ts,
+                                          [50, 75, 90, 95, 99])
+            row.update({f"pct{each}": value for each, value in values.items() if f"pct{each}" in row})
+    return rows
 
 
-def get_issues(args):
-    start_time, end_time, aggregation = _timeframe(args, time_as_ts=True)
-    return list(get_results(args['test_name'], start_time, end_time).values())
+def get_issues(args, ctx=None):
+    start_time, end_time, aggregation = _timeframe(args, time_as_ts=True, ctx=ctx)
+    issues, truncated = get_results(args['test_name'], start_time, end_time)
+    if not args.get('with_total'):
+        return list(issues.values())
+    # clients that ask for it learn whether LOKI_MAX_ENTRIES cut the errors short
+    return {"total": len(issues), "rows": list(issues.values()), "truncated": truncated}
 
 
 def calculate_analytics_dataset(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                                scope, metric, status):
+                                scope, metric, status, timestamps=None, users=None, ctx=None):
     data = None
     axe = 'count'
     if metric == "Throughput":
         timestamps, data, _ = get_tps(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                                      scope=scope, status=status)
+                                      timestamps, users, scope=scope, status=status, ctx=ctx)
         data = data['responses']
     # elif metric == "Hits":
     #     timestamps, data, _ = get_hits(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
@@ -82,81 +429,208 @@ def calculate_analytics_dataset(build_id, test_name, lg_type, start_time, end_ti
     #     data = data['hits']
     elif metric == "Errors":
         timestamps, data, _ = get_errors(build_id, test_name, lg_type, start_time, end_time, aggregation, sampler,
-                                         scope=scope)
+                                         timestamps, users, scope=scope, ctx=ctx)
         data = data['errors']
     elif metric in ["Min", "Median", "Max", "pct90", "pct95", "pct99"]:
         timestamps, data, _ = get_backend_requests(build_id, test_name, lg_type, start_time, end_time, aggregation,
-                                                   sampler, scope=scope, aggr=metric, status=status)
+                                                   sampler, timestamps, users, scope=scope, aggr=metric,
+                                                   status=status, ctx=ctx)
         data = data['response']
         axe = 'time'
 
     elif "xx" in metric:
         timestamps, data, _ = get_response_codes(build_id, test_name, lg_type, start_time, end_time, aggregation,
-                                                 sampler, scope=scope, aggr=metric, status=status)
+                                                 sampler, timestamps, users, scope=scope, aggr=metric,
+                                                 status=status, ctx=ctx)
         data = data['rcodes']
     return data, axe
 
 
-def get_data_from_influx(args):
-    start_time, end_time, aggregation = _timeframe(args)
+def get_data_from_influx(args, ctx=None):
+    ctx = _context(args, ctx)
+    start_time, end_time, aggregation, archive, window = _archived_timeframe(args, ctx)
     metric = args.get('metric', '')
     scope = args.get('scope', '')
+    if archive is not None:
+        if metric == "Users":
+            return create_dataset(archive.timeline(window), archive.series("", "Users", window),
+                                  f"{scope}_{metric}", 'count', **_chart_options(args))
+        if archive.has(scope, metric):
+            axe = 'time' if metric in ["Min", "Median", "Max", "pct90", "pct95", "pct99"] else 'count'
+            return create_dataset(archive.timeline(window), archive.series(scope, metric, window),
+                                  f"{scope}_{metric}", axe, **_chart_options(args))
+    sketches = _sketched(args, ctx, aggregation) if metric in SKETCH_PERCENTILES else None
+    if sketches is not None:
+        timestamps = archive.timeline(window) if archive is not None else \
+            get_backend_users(args['build_id'], args['lg_type'], start_time, end_time, aggregation, ctx=ctx)[0]
+        return create_dataset(timestamps, sketches.series(_sketch_scope(scope), timestamps,
+                                                          aggregation_seconds(aggregation), SKETCH_PERCENTILES[metric]),
+                              f"{scope}_{metric}", 'time', **_chart_options(args))
     timestamps, users = get_backend_users(args['build_id'], args['lg_type'],
-                                          start_time, end_time, aggregation)
+                                          start_time, end_time, aggregation, ctx=ctx)
     axe = 'count'
     if metric == "Users":
-        return create_dataset(timestamps, users['users'], f"{scope}_{metric}", axe)
+        return create_dataset(timestamps, users['users'], f"{scope}_{metric}", axe, **_chart_options(args))
     data, axe = calculate_analytics_dataset(args['build_id'], args['test_name'], args['lg_type'],
                                             start_time, end_time, aggregation, args['sampler'],
-                                            scope, metric, args["status"])
+                                            scope, metric, args["status"], timestamps, users, ctx=ctx)
     if data:
-        return create_dataset(timestamps, data, f"{scope}_{metric}", axe)
+        return create_dataset(timestamps, data, f"{scope}_{metric}", axe, **_chart_options(args))
     else:
         return {}
 
 
+def get_batch_data(args, ctx=None):
+    ctx = _context(args, ctx)
+    start_time, end_time, aggregation, archive, window = _archived_timeframe(args, ctx)
+    specs = []
+    for each in args.get('specs') or []:
+        spec = (each.get('metric', ''), each.get('scope', ''), each.get('status') or args.get('status', 'all'))
+        if spec not in specs:
+            specs.append(spec)
+    series = {}
+    if archive is not None:
+        timestamps, users = archive.timeline(window), {"users": archive.series("", "Users", window)}
+        for metric, scope, status in specs:
+            if status == 'all' and archive.has(scope, metric):
+                series[(metric, scope, status)] = archive.series(scope, metric, window)
+    else:
+        timestamps, users = get_backend_users(args['build_id'], args['lg_type'],
+                                              start_time, end_time, aggregation, ctx=ctx)
+    sketches = _sketched(args, ctx, aggregation)
+    if sketches is not None:
+        for metric, scope, status in specs:
+            if status == 'all' and metric in SKETCH_PERCENTILES:
+                series[(metric, scope, status)] = sketches.series(_sketch_scope(scope), timestamps,
+                                                                  aggregation_seconds(aggregation),
+                                                                  SKETCH_PERCENTILES[metric])
+    missing = [spec for spec in specs if spec[0] != "Users" and spec not in series]
+    if missing:
+        _, fetched = get_batch_series(args['build_id'], args['test_name'], args['lg_type'], start_time, end_time,
+                                      aggregation, args['sampler'], missing, timestamps, ctx=ctx)
+        series.update(fetched)
+    data = {}
+    for metric, scope, status in specs:
+        label = f"{scope}_{metric}" if status == 'all' else f"{scope}_{metric}_{status}"
+        if metric == "Users":
+            data[label] = (users['users'], 'count')
+        elif (metric, scope, status) in series:
+            axe = 'time' if metric in ["Min", "Median", "Max", "pct90", "pct95", "pct99"] else 'count'
+            data[label] = (series[(metric, scope, status)], axe)
+    return comparison_data(timeline=timestamps, data=data, **_chart_options(args))
+
+
+def export_build_archive(build_id, requests):
+    """ Snapshots a finished build at the aggregation of its default full-run view """
+    try:
+        ctx = QueryContext(build_id)
+        if not ctx.finished:
+            return
+        start_time, end_time, aggregation = calculate_proper_timeframe(build_id, ctx.test_name, ctx.lg_type, 0, 100,
+                                                                       ctx.start_time, ctx.end_time, 'auto', ctx=ctx)
+        timestamps, users = get_backend_users(build_id, ctx.lg_type, start_time, end_time, aggregation, ctx=ctx)
+        requests = [name for name in requests if name and name != 'All']
+        specs = [(metric, scope, 'all') for scope in ['All'] + requests for metric in ARCHIVE_METRICS]
+        _, series = get_batch_series(build_id, ctx.test_name, ctx.lg_type, start_time, end_time, aggregation,
+                                     ARCHIVE_SAMPLER, specs, timestamps, ctx=ctx)
+        columns = {("", "Users"): users["users"]}
+        for (metric, scope, _), values in series.items():
+            columns[(scope, metric)] = values
+        write_archive(ctx.project_id, build_id, aggregation, ARCHIVE_SAMPLER, str_to_timestamp(start_time),
+                      str_to_timestamp(end_time), timestamps, columns, requests)
+    except Exception as exc:  # pylint: disable=W0703
+        log.warning("Failed to archive build %s: %s", build_id, exc)
+        return
+    sketch_pool.submit(run_in_app_context(export_build_sketches), build_id, requests,
+                       str_to_timestamp(start_time), str_to_timestamp(end_time))
+
+
+def _sketch_seconds(duration):
+    """ Row width of the finest aggregation that keeps at most SKETCH_MAX_ROWS rows per request """
+    for aggregation in AGGREGATIONS:
+        if duration / aggregation_seconds(aggregation) <= SKETCH_MAX_ROWS:
+            return aggregation_seconds(aggregation)
+    return aggregation_seconds(AGGREGATIONS[-1])
+
+
+def export_build_sketches(build_id, requests, start_ts, end_ts):
+    """ Latency sketches of every request built from raw points streamed in bounded chunks """
+    try:
+        ctx = QueryContext(build_id)
+        start_ts, end_ts = int(start_ts), int(end_ts) + 1
+        builder = SketchBuilder(requests, start_ts, _sketch_seconds(end_ts - start_ts))
+        for name, times, values in iter_response_times(build_id, ctx.test_name, ctx.lg_type, start_ts, end_ts,
+                                                       ARCHIVE_SAMPLER, SKETCH_CHUNK_SIZE, ctx=ctx):
+            builder.add(name, times, values)
+        write_sketches(archive_path(ctx.project_id, build_id), builder)
+    except Exception as exc:  # pylint: disable=W0703
+        log.warning("Failed to sketch build %s: %s", build_id, exc)
+
+
+def schedule_build_archive(project_id, build_id, requests):
+    delete_archive(project_id, build_id)
+    archive_pool.submit(run_in_app_context(export_build_archive), build_id, requests)
+
+
+def _comparison_label(report, metric):
+    return "{}_{}".format(report.start_time.replace("T", " ").split(".")[0], metric)
+
+
+def _comparison_dataset(*args, **kwargs):
+    with query_deadline(COMPARISON_TIMEOUT):
+        return calculate_analytics_dataset(*args, **kwargs)
+
+
 def prepare_comparison_responses(args):
-    tests = args['id[]']
-    tests_meta = []
-    longest_test = 0
-    longest_time = 0
+    tests = [int(each) for each in args['id[]']]
     sampler = args.get('sampler', "REQUEST")
-    for i in range(len(tests)):
-        data = APIReport.query.filter_by(id=tests[i]).first().to_json()
-        if data['duration'] > longest_time:
-            longest_time = data['duration']
+    reports = {each.id: each
+               for each in APIReport.query.filter(APIReport.id.in_(tests), APIReport.deleted.is_(False)).all()}
+    tests_meta = [reports[each] for each in tests if each in reports]
+    contexts = [QueryContext(each.build_id, report=each) for each in tests_meta]
+    longest_test = 0
+    for i in range(len(tests_meta)):
+        if (tests_meta[i].duration or 0) > (tests_meta[longest_test].duration or 0):
             longest_test = i
-        tests_meta.append(data)
-    start_time, end_time, aggregation = calculate_proper_timeframe(tests_meta[longest_test]['build_id'],
-                                                                   tests_meta[longest_test]['name'],
-                                                                   tests_meta[longest_test]['lg_type'],
+    longest = tests_meta[longest_test]
+    start_time, end_time, aggregation = calculate_proper_timeframe(longest.build_id, longest.name, longest.lg_type,
                                                                    args.get('low_value', 0),
                                                                    args.get('high_value', 100),
-                                                                   tests_meta[longest_test]['start_time'],
-                                                                   tests_meta[longest_test]['end_time'],
-                                                                   args.get('aggregator', 'auto'))
+                                                                   longest.start_time, longest.end_time,
+                                                                   args.get('aggregator', 'auto'),
+                                                                   ctx=contexts[longest_test],
+                                                                   max_points=_max_points(args))
+    # every compared build has to hold the shared rollup
+    for each in contexts:
+        aggregation = available_aggregation(aggregation, each.resolutions)
     # if args.get('aggregator', 'auto') != "auto":
     #     aggregation = args.get('aggregator')
     metric = args.get('metric', '')
     scope = args.get('scope', '')
     status = args.get("status", 'all')
-    timestamps, users = get_backend_users(tests_meta[longest_test]['build_id'],
-                                          tests_meta[longest_test]['lg_type'], start_time, end_time, aggregation)
-    test_start_time = "{}_{}".format(tests_meta[longest_test]['start_time'].replace("T", " ").split(".")[0], metric)
-    data = {test_start_time: calculate_analytics_dataset(tests_meta[longest_test]['build_id'],
-                                                         tests_meta[longest_test]['name'],
-                                                         tests_meta[longest_test]['lg_type'],
-                                                         start_time, end_time, aggregation,
-                                                         sampler, scope, metric, status)}
-    for i in range(len(tests_meta)):
-        if i != longest_test:
-            test_start_time = "{}_{}".format(tests_meta[i]['start_time'].replace("T", " ").split(".")[0], metric)
-            data[test_start_time] = calculate_analytics_dataset(tests_meta[i]['build_id'], tests_meta[i]['name'],
-                                                                tests_meta[i]['lg_type'],
-                                                                tests_meta[i]['start_time'],
-                                                                tests_meta[i]['end_time'],
-                                                                aggregation, sampler, scope, metric, status)
-    return comparison_data(timeline=timestamps, data=data)
+    timestamps, users = get_backend_users(longest.build_id, longest.lg_type, start_time, end_time, aggregation,
+                                          ctx=contexts[longest_test])
+    # the longest test is charted within the selected window, the others over their whole run
+    futures = {}
+    for i in [longest_test] + [i for i in range(len(tests_meta)) if i != longest_test]:
+        each = tests_meta[i]
+        window = (start_time, end_time, timestamps, users) if i == longest_test else \
+            (each.start_time, each.end_time, None, None)
+        futures[_comparison_label(each, metric)] = comparison_pool.submit(
+            run_in_app_context(_comparison_dataset), each.build_id, each.name, each.lg_type, window[0],
+            window[1], aggregation, sampler, scope, metric, status, window[2], window[3], ctx=contexts[i]
+        )
+    # each test runs within its own query budget, a failed or timed out test leaves the others in the chart
+    data, failed = {}, []
+    for label, future in futures.items():
+        try:
+            data[label] = future.result()
+        except Exception as exc:  # pylint: disable=W0703
+            log.warning("Comparison dataset %s failed: %s", label, exc)
+            failed.append(label)
+    chart = comparison_data(timeline=timestamps, data=data, **_chart_options(args))
+    chart["failed"] = failed
+    return chart
 
 
 def compare_tests(args):
@@ -168,37 +642,57 @@ def compare_tests(args):
     }
 
 
+def _benchmark_duration(report):
+    try:
+        return str_to_timestamp(report.end_time) - str_to_timestamp(report.start_time)
+    except (TypeError, ValueError):
+        return report.duration or 0
+
+
 def create_benchmark_dataset(args):
     build_ids = args['id[]']
     req = args.get('request')
     calculation = args.get('calculation')
     aggregator = args.get('aggregator')
     status = args.get("status", 'all')
-    if not aggregator or aggregator == 'auto':
-        aggregator = '1s'
-    tests_meta = APIReport.query.filter(APIReport.id.in_(build_ids)).order_by(APIReport.vusers.asc()).all()
+    tests_meta = APIReport.query.filter(
+        APIReport.id.in_(build_ids), APIReport.deleted.is_(False)
+    ).order_by(APIReport.vusers.asc()).all()
+    # percentiles of builds with latency sketches are merged from them rather than from rollup percentiles
+    values = {}
+    percentile = {metric.lower(): each for metric, each in SKETCH_PERCENTILES.items()}.get(calculation)
+    if percentile and status == 'all':
+        for _ in tests_meta:
+            archive = _sketched_archive(_.project_id, _.build_id)
+            if archive is not None:
+                values[_.build_id] = archive.sketches.percentiles(
+                    _sketch_scope(req or ''), archive.index["start"], archive.index["end"], [percentile]
+                )[percentile]
+    groups = {}
+    resolutions = {}
+    for _ in tests_meta:
+        if _.build_id in values:
+            continue
+        key = (_.project_id, _.lg_type, _.name)
+        groups.setdefault(key, {})[_.build_id] = _benchmark_duration(_)
+        if _.resolutions is not None:
+            resolutions[key] = [each for each in resolutions.get(key, _.resolutions) if each in _.resolutions]
+    for key, durations in groups.items():
+        project_id, lg_type, name = key
+        values.update(get_benchmark_values(project_id, name, lg_type, durations, calculation, req, status,
+                                           aggregator=aggregator, resolutions=resolutions.get(key)))
+    if calculation == 'throughput':
+        y_axis = 'Requests per second'
+    elif calculation == 'errors':
+        y_axis = 'Errors'
+    else:
+        y_axis = 'Response time, ms'
     labels = set()
     data = {}
-    y_axis = ''
     for _ in tests_meta:
-        try:
-            labels.add(_.vusers)
-            if _.environment not in data:
-                data[_.environment] = {}
-            if calculation == 'throughput':
-                y_axis = 'Requests per second'
-                data[_.environment][str(_.vusers)] = get_throughput_per_test(
-                    _.build_id, _.name, _.lg_type, "", req, aggregator, status)
-            elif calculation != ['throughput']:
-                y_axis = 'Response time, ms'
-                if calculation == 'errors':
-                    y_axis = 'Errors'
-                data[_.environment][str(_.vusers)] = get_response_time_per_test(
-                    _.build_id, _.name, _.lg_type, "", req, calculation, status, aggregator)
-            else:
-                data[_.environment][str(_.vusers)] = None
-        except IndexError:
-            pass
-
+        labels.add(_.vusers)
+        data.setdefault(_.environment, {})
+        if _.build_id in values:
+            data[_.environment][str(_.vusers)] = values[_.build_id]
     labels = [""] + sorted(list(labels)) + [""]
-    return {"data": chart_data(labels, [], data, "data"), "label": y_axis}
+    return {"data": chart_data(labels, [], data, "data", time_labels=False), "label": y_axis}
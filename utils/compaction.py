@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from threading import Thread
+from time import sleep
+
+from sqlalchemy import func, text
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ...shared.db_manager import engine
+from ..constants import (AGGREGATIONS, COMPACTED_AGGREGATIONS, COMPACTION_AGE_DAYS, COMPACTION_INTERVAL,
+                         COMPACTION_LIMIT, COMPACTION_LOCK_KEY, DELETION_BATCH_SIZE, DELETION_INTERVAL,
+                         TERMINAL_TEST_STATUSES)
+from ..connectors.influx import delete_builds_resolutions
+from ..models.api_reports import APIReport
+from .charts_utils import invalidate_chart_cache
+
+
+def compaction_candidates(max_age_days, limit):
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%dT%H:%M:%S")
+    return APIReport.query.with_entities(
+        APIReport.id, APIReport.project_id, APIReport.build_id, APIReport.name, APIReport.lg_type
+    ).filter(
+        APIReport.deleted.is_(False), APIReport.resolutions.is_(None), APIReport.start_time < cutoff,
+        func.lower(APIReport.test_status["status"].as_string()).in_(TERMINAL_TEST_STATUSES)
+    ).order_by(APIReport.id).limit(limit).all()
+
+
+def compact_builds(max_age_days=COMPACTION_AGE_DAYS, limit=COMPACTION_LIMIT, batch_size=DELETION_BATCH_SIZE):
+    """
+    Drops raw points and fine rollups of finished builds older than max_age_days, keeping the coarse rollups
+    and api_comparison, and records the kept rollups on each report. Only one instance runs at a time
+    """
+    kept = [each for each in AGGREGATIONS if each not in COMPACTED_AGGREGATIONS]
+    compacted = 0
+    with engine.connect() as connection:
+        if not connection.execute(text("select pg_try_advisory_lock(:key)"), {"key": COMPACTION_LOCK_KEY}).scalar():
+            return compacted
+        try:
+            groups = {}
+            for each in compaction_candidates(max_age_days, limit):
+                groups.setdefault((each.project_id, each.lg_type, each.name), []).append(each)
+            for (project_id, lg_type, name), reports in groups.items():
+                for i in range(0, len(reports), batch_size):
+                    batch = reports[i:i + batch_size]
+                    delete_builds_resolutions(project_id, lg_type, name, [each.build_id for each in batch],
+                                              COMPACTED_AGGREGATIONS)
+                    APIReport.query.filter(APIReport.id.in_([each.id for each in batch])).update(
+                        {"resolutions": kept}, synchronize_session=False)
+                    APIReport.query.session.commit()
+                    for each in batch:
+                        invalidate_chart_cache(each.build_id)
+                    compacted += len(batch)
+                    sleep(DELETION_INTERVAL)
+        finally:
+            connection.execute(text("select pg_advisory_unlock(:key)"), {"key": COMPACTION_LOCK_KEY})
+    if compacted:
+        log.info("Compacted %s builds", compacted)
+    return compacted
+
+
+def start_compaction(app, interval=COMPACTION_INTERVAL):
+    if COMPACTION_AGE_DAYS <= 0:
+        return
+
+    def _loop():
+        while True:
+            sleep(interval)
+            with app.app_context():
+                try:
+                    compact_builds()
+                except Exception as exc:  # pylint: disable=W0703
+                    log.error("Build compaction failed: %s", exc)
+                    APIReport.query.session.rollback()
+
+    Thread(target=_loop, name="backend_compaction", daemon=True).start()
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from queue import Queue
+from threading import Lock, Thread
+from time import monotonic, sleep
+from uuid import uuid4
+
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ..constants import DELETION_BATCH_SIZE, DELETION_INTERVAL, DELETION_JOBS_KEPT, DELETION_RECOVERY_INTERVAL
+from ..connectors.influx import delete_builds_data, delete_builds_comparison
+from ..models.api_baseline import APIBaseline
+from ..models.api_reports import APIReport
+from .utils import run_in_app_context
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class DeletionWorker:
+    """
+    Background removal of reports already marked as deleted: Influx data in batches, then database rows.
+    Reports still marked deleted are picked up again at startup and on every recovery pass
+    """
+
+    def __init__(self, batch_size=DELETION_BATCH_SIZE, interval=DELETION_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = Queue()
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+        self._thread = None
+        self._last_statement = 0
+        self._pending = set()
+
+    def submit(self, project_id, reports):
+        """ :param reports: - (id, build_id, name, lg_type) of each report """
+        job_id = uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "project_id": project_id, "status": "queued",
+                                  "report_ids": [each[0] for each in reports], "error": None}
+            self._pending.update(each[0] for each in reports)
+            while len(self._jobs) > DELETION_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=run_in_app_context(self._run), name="backend_deletion", daemon=True)
+                self._thread.start()
+        self._queue.put((job_id, project_id, reports))
+        return job_id
+
+    def progress(self, job_id):
+        """ Job state with counts taken from the reports still present in the database """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            job = dict(job)
+        report_ids = job.pop("report_ids")
+        remaining = APIReport.query.filter(APIReport.id.in_(report_ids)).count() if report_ids else 0
+        job.update(total=len(report_ids), deleted=len(report_ids) - remaining)
+        if not remaining:
+            job["status"] = "finished"
+        return job
+
+    def recover(self):
+        """ Queues reports marked deleted that no job holds, left over by a restart or a failed job """
+        with self._lock:
+            pending = set(self._pending)
+        reports = APIReport.query.with_entities(
+            APIReport.project_id, APIReport.id, APIReport.build_id, APIReport.name, APIReport.lg_type
+        ).filter(APIReport.deleted.is_(True)).order_by(APIReport.id).all()
+        projects = {}
+        for project_id, *report in reports:
+            if report[0] not in pending:
+                projects.setdefault(project_id, []).append(tuple(report))
+        for project_id, orphans in projects.items():
+            log.info("Resuming deletion of %s reports of project %s", len(orphans), project_id)
+            self.submit(project_id, orphans)
+        return sum(len(each) for each in projects.values())
+
+    def _update(self, job_id, **kwargs):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(kwargs)
+
+    def _throttle(self):
+        wait = self._last_statement + self.interval - monotonic()
+        if wait > 0:
+            sleep(wait)
+        self._last_statement = monotonic()
+
+    def _run(self):
+        while True:
+            job_id, project_id, reports = self._queue.get()
+            try:
+                self._process(job_id, project_id, reports)
+            except Exception as exc:  # pylint: disable=W0703
+                log.error("Report deletion %s failed: %s", job_id, exc)
+                APIReport.query.session.rollback()
+                self._update(job_id, status="failed", error=str(exc))
+            finally:
+                with self._lock:
+                    self._pending.difference_update(report_id for report_id, _, _, _ in reports)
+                self._queue.task_done()
+
+    def _process(self, job_id, project_id, reports):
+        self._update(job_id, status="running")
+        tests = {}
+        for _, build_id, name, lg_type in reports:
+            tests.setdefault((lg_type, name), []).append(build_id)
+        for (lg_type, name), build_ids in tests.items():
+            for batch in _chunks(build_ids, self.batch_size):
+                self._throttle()
+                delete_builds_data(project_id, lg_type, name, batch)
+        for batch in _chunks([build_id for _, build_id, _, _ in reports], self.batch_size):
+            self._throttle()
+            delete_builds_comparison(project_id, batch)
+        report_ids = [report_id for report_id, _, _, _ in reports]
+        APIBaseline.query.filter(
+            APIBaseline.project_id == project_id, APIBaseline.report_id.in_(report_ids)
+        ).delete(synchronize_session=False)
+        APIReport.query.filter(
+            APIReport.project_id == project_id, APIReport.id.in_(report_ids)
+        ).delete(synchronize_session=False)
+        APIReport.query.session.commit()
+        self._update(job_id, status="finished")
+
+
+deletion_worker = DeletionWorker()
+
+
+def start_deletion_recovery(app, interval=DELETION_RECOVERY_INTERVAL):
+    def _loop():
+        while True:
+            with app.app_context():
+                try:
+                    deletion_worker.recover()
+                except Exception as exc:  # pylint: disable=W0703
+                    log.error("Report deletion recovery failed: %s", exc)
+                    APIReport.query.session.rollback()
+            sleep(interval)
+
+    Thread(target=_loop, name="backend_deletion_recovery", daemon=True).start()
@@ -0,0 +1,69 @@
+import gzip
+from hashlib import sha1
+
+import orjson
+from flask import request, Response
+
+from ..constants import COMPRESSION_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_etag(*parts, weak=False):
+    digest = sha1(orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(etag):
+    """ Weak comparison of the If-None-Match header against etag """
+    header = request.headers.get("If-None-Match", "")
+    if not etag or not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def _accepted_encodings():
+    encodings = set()
+    for each in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = each.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def encode_json(payload):
+    return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def encoded_response(payload, etag=None, mimetype="application/json", status=200):
+    body = payload if isinstance(payload, bytes) else encode_json(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    if len(body) >= COMPRESSION_MIN_BYTES:
+        encodings = _accepted_encodings()
+        if brotli is not None and "br" in encodings:
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in encodings:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+
+def conditional_response(etag, build, mimetype="application/json"):
+    """ 304 when the client already holds etag, otherwise the encoded result of build() """
+    if etag_matches(etag):
+        return Response(status=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+    return encoded_response(build(), etag, mimetype)
@@ -0,0 +1,160 @@
+from queue import Queue, Empty, Full
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ..constants import CHART_CACHE_RUNNING_TTL, LIVE_STREAM_INTERVAL, LIVE_STREAM_HEARTBEAT, LIVE_STREAM_QUEUE_SIZE
+from ..connectors.query_context import QueryContext
+from .charts_utils import requests_summary, requests_hits, avg_responses, incremental_chart, live_args_key
+from .utils import run_in_app_context
+
+# streamed charts share the whole-run prefix of the polled /chart/requests/<target> endpoints
+LIVE_CHARTS = {"summary": requests_summary, "hits": requests_hits, "average": avg_responses}
+
+
+class Subscription:
+    """ Events of one viewer, a viewer that falls behind by a full queue is closed """
+
+    def __init__(self, key):
+        self.key = key
+        self.fresh = True
+        self.closed = False
+        self._queue = Queue(maxsize=LIVE_STREAM_QUEUE_SIZE)
+
+    def put(self, event, data=None):
+        try:
+            self._queue.put_nowait((event, data))
+        except Full:
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+
+    def events(self, heartbeat=LIVE_STREAM_HEARTBEAT):
+        """ Yields (event, data) pairs, (None, None) when nothing happened for heartbeat seconds """
+        while True:
+            try:
+                event, data = self._queue.get(timeout=heartbeat)
+            except Empty:
+                if self.closed:
+                    return
+                yield None, None
+                continue
+            yield event, data
+            if event == "end":
+                return
+
+
+class BuildPoller:
+    """
+    Refreshes the live charts of a build once per interval and broadcasts the new points to every subscriber,
+    new subscribers get full charts built from the same refresh
+    """
+
+    def __init__(self, hub, key, args, interval=LIVE_STREAM_INTERVAL):
+        self.hub = hub
+        self.key = key
+        self.args = args
+        self.interval = interval
+        self.subscribers = set()
+        self.wake = Event()
+        self._cursors = {}
+        self._next = 0
+
+    def _charts(self, ctx, since=None, max_age=CHART_CACHE_RUNNING_TTL):
+        charts = {}
+        for name, func in LIVE_CHARTS.items():
+            args = dict(self.args, since=self._cursors.get(name, "") if since is None else since)
+            charts[name] = incremental_chart("requests", name, func, args, ctx=ctx, max_age=max_age)
+        return charts
+
+    def _round(self, subscribers):
+        ctx = QueryContext(self.args['build_id'])
+        fresh = [each for each in subscribers if each.fresh]
+        if monotonic() >= self._next:
+            self._next = monotonic() + self.interval
+            charts = self._charts(ctx, max_age=0)
+            for name, payload in charts.items():
+                self._cursors[name] = payload["cursor"]
+                for each in subscribers:
+                    if not each.fresh:
+                        each.put(name, payload)
+        if fresh:
+            charts = self._charts(ctx, since="")
+            for each in fresh:
+                for name, payload in charts.items():
+                    each.put(name, payload)
+                each.fresh = False
+        return ctx.finished
+
+    def run(self):
+        while True:
+            self.wake.wait(timeout=max(self._next - monotonic(), 0))
+            self.wake.clear()
+            subscribers = self.hub.subscribers(self)
+            if not subscribers:
+                return
+            try:
+                finished = self._round(subscribers)
+            except Exception as exc:  # pylint: disable=W0703
+                log.warning("Live charts of %s failed: %s", self.args['build_id'], exc)
+                continue
+            if finished:
+                for each in self.hub.close(self):
+                    each.put("end")
+                return
+
+
+class LiveHub:
+    """ One poller per running build chart set, so Influx load follows running builds rather than viewers """
+
+    def __init__(self):
+        self._pollers = {}
+        self._lock = Lock()
+
+    def subscribe(self, args):
+        key = (args['build_id'], live_args_key(args))
+        subscription = Subscription(key)
+        with self._lock:
+            poller = self._pollers.get(key)
+            started = poller is None
+            if started:
+                poller = self._pollers[key] = BuildPoller(self, key, dict(args))
+            poller.subscribers.add(subscription)
+        if started:
+            Thread(target=run_in_app_context(poller.run), name="backend_live", daemon=True).start()
+        poller.wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            poller = self._pollers.get(subscription.key)
+            if poller is not None:
+                poller.subscribers.discard(subscription)
+                if not poller.subscribers:
+                    poller.wake.set()
+
+    def subscribers(self, poller):
+        """ Open subscribers of a poller, a poller left without any is removed and should stop """
+        with self._lock:
+            poller.subscribers = {each for each in poller.subscribers if not each.closed}
+            if not poller.subscribers and self._pollers.get(poller.key) is poller:
+                del self._pollers[poller.key]
+            return list(poller.subscribers)
+
+    def close(self, poller):
+        with self._lock:
+            if self._pollers.get(poller.key) is poller:
+                del self._pollers[poller.key]
+            subscribers, poller.subscribers = poller.subscribers, set()
+        return subscribers
+
+    def stats(self):
+        with self._lock:
+            return {"pollers": len(self._pollers),
+                    "subscribers": sum(len(each.subscribers) for each in self._pollers.values())}
+
+
+live_hub = LiveHub()
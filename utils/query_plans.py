@@ -0,0 +1,85 @@
+from json import loads
+
+from sqlalchemy import text
+from pylon.core.tools import log  # pylint: disable=E0611,E0401
+
+from ...shared.db_manager import engine
+from ..constants import QUERY_PLAN_ROWS
+
+SCRATCH_TABLES = ("api_report", "api_report_request", "api_baseline", "api_thresholds")
+
+# temporary copies shadow the module tables for this session only, so production rows are neither touched
+# nor mixed into the plans; ids are given explicitly to leave the production sequences alone
+SCRATCH_SCHEMA = tuple(
+    statement
+    for table in SCRATCH_TABLES
+    for statement in (f"create temp table {table} (like {table} including defaults including indexes) "
+                      f"on commit drop",
+                      f"alter table pg_temp.{table} alter column id drop default")
+)
+
+SYNTHETIC_DATA = (
+    "insert into pg_temp.api_report (id, project_id, test_uid, name, environment, type, start_time, end_time, "
+    "build_id, lg_type, requests, test_status, failures, total, duration) "
+    "select g, g % 100 + 1, 'uid_' || g % 500, 'test_' || g % 50, 'env_' || g % 5, 'load', "
+    "to_char(timestamp '2021-01-01' + g * interval '1 minute', 'YYYY-MM-DD\"T\"HH24:MI:SS.000\"Z\"'), '', "
+    "'query_plan_check_' || g, 'jmeter', 'All;request_1;request_2', '{\"status\": \"Finished\"}', 0, 100, 60 "
+    "from generate_series(1, :rows) g",
+    "insert into pg_temp.api_report_request (id, report_id, project_id, test, environment, request_name) "
+    "select row_number() over (), r.id, r.project_id, r.name, r.environment, 'request_' || n "
+    "from pg_temp.api_report r, generate_series(1, 5) n",
+    "insert into pg_temp.api_baseline (id, project_id, report_id, test, environment, summary) "
+    "select row_number() over (), project_id, max(id), name, environment, '{}' from pg_temp.api_report "
+    "group by project_id, name, environment",
+    "insert into pg_temp.api_thresholds (id, project_id, test, environment, scope, value, target, aggregation, "
+    "comparison) "
+    "select g, g % 100 + 1, 'test_' || g % 50, 'env_' || g % 5, 'All', 500, 'response_time', 'pct95', 'gte' "
+    "from generate_series(1, :rows / 10) g",
+    "analyze pg_temp.api_report, pg_temp.api_report_request, pg_temp.api_baseline, pg_temp.api_thresholds",
+)
+
+HOT_PATHS = {
+    "reports_list": "select id from api_report where project_id = 1 order by id desc limit 20",
+    "reports_list_by_start_time": "select id from api_report where project_id = 1 "
+                                  "order by start_time desc, id desc limit 20",
+    "report_status": "select test_status from api_report where project_id = 1 and id = 101",
+    "environments": "select distinct environment from api_report where project_id = 1 and name = 'test_1'",
+    "requests": "select distinct request_name from api_report_request "
+                "where project_id = 1 and test = 'test_1' and environment = 'env_1' order by request_name",
+    "baseline": "select id from api_baseline where project_id = 1 and test = 'test_1' and environment = 'env_1'",
+    "baseline_by_report": "select id from api_baseline where project_id = 1 and report_id = 101",
+    "thresholds": "select id from api_thresholds where project_id = 1 and test = 'test_1' and environment = 'env_1'",
+}
+
+
+def _seq_scans(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for each in plan.get("Plans", []):
+        yield from _seq_scans(each)
+
+
+def check_query_plans(rows=QUERY_PLAN_ROWS):
+    """
+    Loads a synthetic dataset into temporary copies of the module tables, which shadow them for the session,
+    and reports which hot filter paths are planned with sequential scans. The copies are dropped on rollback
+    """
+    results = {}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for statement in SCRATCH_SCHEMA:
+                connection.execute(text(statement))
+            for statement in SYNTHETIC_DATA:
+                connection.execute(text(statement), {"rows": rows})
+            for name, query in HOT_PATHS.items():
+                plan = connection.execute(text(f"explain (format json) {query}")).scalar()
+                if isinstance(plan, str):
+                    plan = loads(plan)
+                seq_scans = sorted(set(_seq_scans(plan[0]["Plan"])))
+                if seq_scans:
+                    log.warning("Query path %s scans %s sequentially", name, ", ".join(seq_scans))
+                results[name] = {"seq_scans": seq_scans, "cost": plan[0]["Plan"]["Total Cost"]}
+        finally:
+            transaction.rollback()
+    return results
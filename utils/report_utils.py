@@ -1,6 +1,11 @@
 import random
+from base64 import b64encode
 from datetime import datetime, timezone
-from ...shared.constants import str_to_timestamp
+from functools import lru_cache
+
+import numpy as np
+
+from ...shared.constants import str_to_timestamp, MAX_DOTS_ON_CHART
 from ..connectors.influx import calculate_auto_aggregation
 
 
@@ -24,12 +29,146 @@ def colors(n):
         return [(0, 0, 0)]
 
 
-def create_dataset(timeline, data, label, axe):
-    labels = []
-    for _ in timeline:
-        labels.append(datetime.strptime(_, "%Y-%m-%dT%H:%M:%SZ").strftime("%m-%d %H:%M:%S"))
-    r, g, b = colors(1)[0]
+@lru_cache(maxsize=64)
+def _day_prefix(day):
+    return datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%m-%d ")
+
+
+def format_label(ts):
+    if isinstance(ts, int):
+        day, seconds = divmod(ts, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{_day_prefix(day)}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    try:
+        return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ").strftime("%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return ts
+
+
+def format_labels(timeline):
+    return [format_label(_) for _ in timeline]
+
+
+def lttb_indices(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets over the non-null points of a series,
+    returns positions of the kept points in the original series
+    """
+    y = np.array([np.nan if _ is None else _ for _ in values], dtype=float)
+    x = np.flatnonzero(~np.isnan(y))
+    if threshold < 3 or len(x) <= threshold:
+        return x
+    y = y[x]
+    # first and last points are always kept, the rest is split into threshold - 2 buckets
+    edges = np.append(np.linspace(1, len(x) - 1, threshold - 1).astype(int), len(x))
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, len(x) - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end, next_end = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        kept[bucket + 1] = selected
+    return x[kept]
+
+
+def _b64(array):
+    return b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def _run_lengths(deltas):
+    if not len(deltas):
+        return []
+    starts = np.flatnonzero(np.diff(deltas)) + 1
+    bounds = np.append(starts, len(deltas))
+    return [[int(deltas[start]), int(end - start)] for start, end in zip(np.insert(starts, 0, 0), bounds)]
+
+
+def _epoch(ts):
+    return ts if isinstance(ts, int) else int(str_to_timestamp(ts))
+
+
+def columnar_chart(chart, timeline):
+    """
+    Compact form of a chart: one epoch timeline as run-length [delta, count] pairs, little-endian float32 values
+    with a packed null bitmask per dataset (base64) and styling shared by all datasets sent once
+    """
+    epochs = np.array([_epoch(_) for _ in timeline], dtype="<i8")
+    datasets = []
+    for each in chart["datasets"]:
+        values = np.array([np.nan if _ is None else _ for _ in each["data"]], dtype="<f4")
+        nulls = np.isnan(values)
+        datasets.append({
+            "style": {key: value for key, value in each.items() if key != "data"},
+            "values": _b64(np.where(nulls, 0, values).astype("<f4")),
+            "nulls": _b64(np.packbits(nulls, bitorder="little")) if nulls.any() else None
+        })
+    shared = {}
+    if datasets:
+        shared = {key: value for key, value in datasets[0]["style"].items()
+                  if all(key in each["style"] and each["style"][key] == value for each in datasets[1:])}
+        for each in datasets:
+            each["style"] = {key: value for key, value in each["style"].items() if key not in shared}
     return {
+        "format": "columnar",
+        "length": len(epochs),
+        "timeline": {
+            "start": int(epochs[0]) if len(epochs) else None,
+            "deltas": _run_lengths(np.diff(epochs))
+        },
+        "dtype": "float32",
+        "style": shared,
+        "datasets": datasets
+    }
+
+
+def envelope(datasets, length):
+    """
+    Largest distance of any dataset scaled to [0, 1] from its own median,
+    so that both peaks and dips of every dataset shape it
+    """
+    distance = np.full((len(datasets) + 1, length), -np.inf)
+    for row, each in enumerate(datasets):
+        values = np.array([np.nan if _ is None else _ for _ in each["data"]], dtype=float)
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        low, high = values[present].min(), values[present].max()
+        scaled = (values - low) / (high - low) if high > low else np.zeros(length)
+        distance[row] = np.where(present, np.abs(scaled - np.median(scaled[present])), -np.inf)
+    result = distance.max(axis=0)
+    result[np.isneginf(result)] = np.nan
+    # the first and last labels are always kept
+    result[[0, -1]] = np.nan_to_num(result[[0, -1]])
+    return result
+
+
+def pack_chart(chart, timeline, downsample=0, columnar=False, epochs=False):
+    """
+    Keeps the LTTB points of the envelope of all datasets so that datasets stay aligned with labels
+    and the chart holds at most downsample points whatever the number of datasets,
+    then converts the chart to the requested payload format, epochs adds the raw timeline to a json chart
+    """
+    if downsample and len(chart["labels"]) > downsample:
+        positions = lttb_indices(envelope(chart["datasets"], len(chart["labels"])), downsample).tolist()
+        chart["labels"] = [chart["labels"][_] for _ in positions]
+        for each in chart["datasets"]:
+            each["data"] = [each["data"][_] for _ in positions]
+        timeline = [timeline[_] for _ in positions]
+    if columnar:
+        return columnar_chart(chart, timeline)
+    if epochs:
+        chart["timeline"] = [_epoch(_) for _ in timeline]
+    return chart
+
+
+def create_dataset(timeline, data, label, axe, downsample=0, columnar=False, epochs=False):
+    labels = format_labels(timeline)
+    r, g, b = colors(1)[0]
+    return pack_chart({
         "labels": labels,
         "datasets": [
             {
@@ -44,13 +183,11 @@ def create_dataset(timeline, data, label, axe):
                 "borderColor": f"rgb({r}, {g}, {b})"
             }
         ]
-    }
+    }, timeline, downsample, columnar, epochs)
 
 
-def comparison_data(timeline, data):
-    labels = []
-    for _ in timeline:
-        labels.append(datetime.strptime(_, "%Y-%m-%dT%H:%M:%SZ").strftime("%m-%d %H:%M:%S"))
+def comparison_data(timeline, data, downsample=0, columnar=False, epochs=False):
+    labels = format_labels(timeline)
     chart_data = {
         "labels": labels,
         "datasets": [
@@ -71,16 +208,12 @@ def comparison_data(timeline, data):
             "borderColor": f"rgb({color[0]}, {color[1]}, {color[2]})"
         }
         chart_data["datasets"].append(dataset)
-    return chart_data
+    return pack_chart(chart_data, timeline, downsample, columnar, epochs)
 
 
-def chart_data(timeline, users, other, yAxis="response_time"):
-    labels = []
-    try:
-        for _ in timeline:
-            labels.append(datetime.strptime(_, "%Y-%m-%dT%H:%M:%SZ").strftime("%m-%d %H:%M:%S"))
-    except:
-        labels = timeline
+def chart_data(timeline, users, other, yAxis="response_time", time_labels=True, downsample=0, columnar=False,
+               epochs=False):
+    labels = format_labels(timeline) if time_labels else list(timeline)
     _data = {
         "labels": labels,
         "datasets": []
@@ -106,13 +239,11 @@ def chart_data(timeline, users, other, yAxis="response_time"):
             "borderColor": f"rgb({color[0]}, {color[1]}, {color[2]})",
             "data": []
         }
+        values = other[each]
         for _ in timeline:
-            if str(_) in other[each]:
-                dataset['data'].append(other[each][str(_)])
-            else:
-                dataset['data'].append(None)
+            dataset['data'].append(values[_] if _ in values else values.get(str(_)))
         _data['datasets'].append(dataset)
-    return _data
+    return pack_chart(_data, timeline, downsample, columnar, epochs)
 
 
 def render_analytics_control(requests):
@@ -142,7 +273,7 @@ def render_analytics_control(requests):
 
 
 def calculate_proper_timeframe(build_id, test_name, lg_type, low_value, high_value, start_time, end_time,
-                               aggregation, time_as_ts=False):
+                               aggregation, time_as_ts=False, ctx=None, max_points=MAX_DOTS_ON_CHART):
     start_time = str_to_timestamp(start_time)
     end_time = str_to_timestamp(end_time)
     interval = end_time - start_time
@@ -156,5 +287,6 @@ def calculate_proper_timeframe(build_id, test_name, lg_type, low_value, high_val
     start_time = datetime.fromtimestamp(start_time).strftime(t_format)
     end_time = datetime.fromtimestamp(end_time).strftime(t_format)
     if aggregation == 'auto':
-        aggregation = calculate_auto_aggregation(build_id, test_name, lg_type, start_time, end_time)
+        aggregation = calculate_auto_aggregation(build_id, test_name, lg_type, start_time, end_time, ctx=ctx,
+                                                 max_points=max_points)
     return start_time, end_time, aggregation
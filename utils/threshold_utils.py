@@ -0,0 +1,88 @@
+import numpy as np
+
+from ..connectors.influx import get_aggregated_test_results
+from ..models.api_thresholds import APIThresholds
+
+SUMMARY_FIELDS = ["min", "max", "mean", "pct50", "pct75", "pct90", "pct95", "pct99", "throughput", "total", "ko"]
+METRICS = SUMMARY_FIELDS + ["error_rate"]
+# a threshold is missed when the actual value satisfies its comparison
+COMPARISONS = {
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+    "eq": np.equal,
+    "neq": np.not_equal
+}
+
+
+def threshold_metric(target, aggregation):
+    if target == "response_time":
+        return "mean" if aggregation == "avg" else aggregation
+    return target
+
+
+def summary_matrix(rows):
+    """ Scope names and a (scope x metric) float matrix of api_comparison rows, NaN where a value is missing """
+    scopes = [row["request_name"] for row in rows]
+    matrix = np.array([[np.nan if row.get(field) is None else row[field] for field in SUMMARY_FIELDS]
+                       for row in rows], dtype=float).reshape(len(rows), len(SUMMARY_FIELDS))
+    total, ko = matrix[:, SUMMARY_FIELDS.index("total")], matrix[:, SUMMARY_FIELDS.index("ko")]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error_rate = np.where(total > 0, ko / total * 100, np.nan)
+    return scopes, np.column_stack([matrix, error_rate])
+
+
+def load_thresholds(project_id, test_name, environment):
+    return APIThresholds.query.with_entities(
+        APIThresholds.id, APIThresholds.scope, APIThresholds.target, APIThresholds.aggregation,
+        APIThresholds.comparison, APIThresholds.value
+    ).filter_by(project_id=project_id, test=test_name, environment=environment).all()
+
+
+def evaluate_thresholds(project_id, build_id, test_name, environment, ctx=None, rows=None):
+    """
+    Evaluates every threshold of a (test, environment) against the build summary in one pass.
+    Scope "every" expands to each request, thresholds without data are reported with passed None.
+    Already fetched api_comparison rows can be passed to skip the query
+    """
+    thresholds = load_thresholds(project_id, test_name, environment)
+    if not thresholds:
+        return {"missed": 0, "results": []}
+    if rows is None:
+        results = get_aggregated_test_results(test_name, build_id, ctx=ctx)
+        rows = list(results[0]) if results else []
+    scopes, matrix = summary_matrix(rows)
+    index = {name: i for i, name in enumerate(scopes)}
+    requests = [i for i, name in enumerate(scopes) if name != "All"]
+    rows, scope_idx, metric_idx = [], [], []
+    for threshold in thresholds:
+        metric = threshold_metric(threshold.target, threshold.aggregation)
+        targets = requests if threshold.scope == "every" else [index.get(threshold.scope, -1)]
+        for each in targets:
+            rows.append((threshold, scopes[each] if each >= 0 else threshold.scope))
+            scope_idx.append(each)
+            metric_idx.append(METRICS.index(metric) if metric in METRICS else -1)
+    scope_idx, metric_idx = np.array(scope_idx, dtype=int), np.array(metric_idx, dtype=int)
+    known = (scope_idx >= 0) & (metric_idx >= 0)
+    actual = np.full(len(rows), np.nan)
+    if len(scopes):
+        actual[known] = matrix[scope_idx[known], metric_idx[known]]
+    values = np.array([threshold.value for threshold, _ in rows], dtype=float)
+    comparisons = np.array([threshold.comparison for threshold, _ in rows])
+    missed = np.zeros(len(rows), dtype=bool)
+    for name, compare in COMPARISONS.items():
+        mask = comparisons == name
+        if mask.any():
+            missed[mask] = compare(actual[mask], values[mask])
+    has_data = ~np.isnan(actual) & np.isin(comparisons, list(COMPARISONS))
+    missed &= has_data
+    output = []
+    for (threshold, scope), value, failed, evaluated in zip(rows, actual.tolist(), missed.tolist(),
+                                                            has_data.tolist()):
+        output.append({
+            "id": threshold.id, "scope": scope, "target": threshold.target, "aggregation": threshold.aggregation,
+            "comparison": threshold.comparison, "value": threshold.value,
+            "actual": value if evaluated else None, "passed": (not failed) if evaluated else None
+        })
+    return {"missed": int(missed.sum()), "results": output}
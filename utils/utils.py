@@ -1,16 +1,31 @@
 import docker
 import operator
-from sqlalchemy import and_
-from json import loads
+from sqlalchemy import and_, or_, func, cast, Integer, Float, Numeric
+from json import loads, dumps
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 import re
 from datetime import datetime
+from functools import wraps
 from uuid import uuid4
 
 from ..constants import JOB_CONTAINER_MAPPING, JOB_TYPE_MAPPING
+from ..models.api_reports import APIReport
 from ...projects.models.statistics import Statistic
 from ...tasks.api.utils import run_task
 
 
+def run_in_app_context(func):
+    """ Wraps func to run under the current Flask app context, for use in worker threads """
+    from flask import current_app
+    app = current_app._get_current_object()  # pylint: disable=W0212
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 def compile_tests(project_id, file_name, runner):
     from flask import current_app
     client = docker.from_env()
@@ -80,6 +95,14 @@ def get_backend_test_data(event):
     return data
 
 
+def encode_cursor(values):
+    return urlsafe_b64encode(dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return loads(urlsafe_b64decode(cursor.encode()))
+
+
 def _calculate_limit(limit, total):
     return len(total) if limit == 'All' else limit
 
@@ -104,3 +127,89 @@ def get(project, args, data_model, additional_filter=None):
     res = data_model.query.filter(filter_).order_by(sort_rule).limit(
         _calculate_limit(limit_, total)).offset(offset_).all()
     return total, res
+
+
+def report_fingerprint(*filters):
+    """ Revision marker of matching reports that changes when one is added, removed or updated """
+    return list(APIReport.query.with_entities(
+        func.count(APIReport.id), func.max(APIReport.id), func.max(APIReport.updated_at)
+    ).filter(*filters).first())
+
+
+def report_columns(include=()):
+    """ Listing projection of api_report, computed fields are derived in SQL """
+    columns = [column for column in APIReport.__table__.columns
+               if column.name not in ("requests", "start_time", "duration")]
+    columns += [
+        func.split_part(func.replace(APIReport.start_time, "T", " "), ".", 1).label("start_time"),
+        cast(func.coalesce(APIReport.duration, 0), Integer).label("duration"),
+        cast(func.coalesce(func.round(cast(APIReport.failures * 100.0 / func.nullif(APIReport.total, 0), Numeric),
+                                      2), 0), Float).label("failure_rate")
+    ]
+    if "requests" in include:
+        columns.append(func.string_to_array(APIReport.requests, ";").label("requests"))
+    return columns
+
+
+def valid_cursor(cursor):
+    try:
+        last = decode_cursor(cursor)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(last, list) and len(last) == 2 and isinstance(last[1], int)
+
+
+def _after_cursor(last, sort_column, id_column, descending):
+    """ Keyset condition for rows past the cursor in (sort column NULLS LAST, id) order """
+    sort_last, id_last = last
+    after = operator.lt if descending else operator.gt
+    if sort_column is id_column:
+        return after(id_column, id_last)
+    if sort_last is None:
+        return and_(sort_column.is_(None), after(id_column, id_last))
+    return or_(after(sort_column, sort_last), and_(sort_column == sort_last, after(id_column, id_last)),
+               sort_column.is_(None))
+
+
+def get_page(project, args, data_model, columns, additional_filter=None):
+    """
+    Single query for a page of projected rows with the total attached by a window function.
+    Pages by keyset on (sort column, id) when args carry a cursor, by offset otherwise
+    """
+    sort_column = getattr(data_model, args["sort"]) if args.get("sort") else data_model.id
+    descending = (args.get("order") or ("asc" if args.get("sort") else "desc")) != "asc"
+    filter_ = [operator.eq(data_model.project_id, project.id)]
+    if additional_filter:
+        for key, value in additional_filter.items():
+            filter_.append(operator.eq(getattr(data_model, key), value))
+    if args.get('filter'):
+        for key, value in loads(args.get("filter")).items():
+            filter_.append(operator.eq(getattr(data_model, key), value))
+    keys = [sort_column, data_model.id] if sort_column is not data_model.id else [data_model.id]
+    query = data_model.query.with_entities(*columns, func.count().over().label("_total")).filter(*filter_)
+    if args.get("cursor"):
+        # the window counts rows after the cursor only, the full total comes from a scalar subquery
+        query = data_model.query.with_entities(
+            *columns, data_model.query.with_entities(func.count()).filter(*filter_).label("_total")
+        ).filter(*filter_, _after_cursor(decode_cursor(args["cursor"]), sort_column, data_model.id, descending))
+    order = [each.desc() if descending else each.asc() for each in keys]
+    if sort_column is not data_model.id:
+        # nulls of the sort column always come last so that the cursor condition can step over them
+        order[0] = order[0].nullslast()
+    query = query.order_by(*order)
+    if args.get("limit"):
+        query = query.limit(args["limit"])
+    if args.get("offset") and not args.get("cursor"):
+        query = query.offset(args["offset"])
+    names = [column.name for column in columns]
+    rows = query.add_columns(sort_column.label("_sort"), data_model.id.label("_id")).all()
+    if rows:
+        total = rows[0]._total
+    elif args.get("offset") or args.get("cursor"):
+        total = data_model.query.filter(*filter_).count()
+    else:
+        total = 0
+    next_cursor = None
+    if args.get("limit") and len(rows) == args["limit"]:
+        next_cursor = encode_cursor([rows[-1]._sort, rows[-1]._id])
+    return total, [dict(zip(names, row)) for row in rows], next_cursor